@@ -0,0 +1,161 @@
+"""
+HOT PATH BENCHMARKS
+
+Runs the bot's hot paths against in-memory fakes of Discord and Google Calendar, and reports throughput and memory for each.
+
+Usage: python benchmarks/bench_hotpaths.py [--messages 5000] [--events 500] [--repeat 3]
+
+For each benchmark:
+    ops/s - operations per second, best of --repeat runs
+    us/op - microseconds per operation, best of --repeat runs
+    peak KiB - peak memory allocated while running it (measured in a separate run under tracemalloc)
+    kept KiB - memory still allocated after it finished
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+import fakes
+
+async def measure(name: str, operations: int, run, repeat: int, setup=None) -> None:
+    """
+    Times a benchmark and measures its memory, then prints a row for it.
+
+    Arguments:
+        Name - benchmark name.
+        Operations - number of operations one run does.
+        Run - coroutine function doing one run.
+        Repeat - number of timed runs.
+        Setup - coroutine function ran before each run, untimed.
+
+    Returns: None
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if setup:
+            await setup()
+        start = time.perf_counter()
+        await run()
+        best = min(best, time.perf_counter() - start)
+
+    if setup:
+        await setup()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    await run()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:<36} {operations:>7} {operations / best:>12.0f} {best / operations * 1e6:>10.1f} {(peak - before) / 1024:>10.1f} {(after - before) / 1024:>10.1f}")
+
+async def main(messageCount: int, eventCount: int, repeat: int) -> None:
+    bot = fakes.importBot()
+    import gcal
+    import outbound
+
+    # Measure the bot's own cost, not the time spent waiting out rate limits
+    outbound.bucketRates = {}
+
+    channel = fakes.FakeChannel()
+    fakes.attachChannel(bot, channel)
+    guildConfig = bot.getGuildConfig(channel.guild.id)
+
+    events = fakes.makeEvents(eventCount)
+    service = fakes.FakeCalendarService(events)
+    gcal.getService = lambda: service
+
+    print(f"{messageCount} channel messages, {eventCount} calendar events\n")
+    print(f"{'benchmark':<36} {'ops':>7} {'ops/s':>12} {'us/op':>10} {'peak KiB':>10} {'kept KiB':>10}")
+
+    # Calendar sync
+    async def resetCalendar():
+        gcal.syncTokens.clear()
+        gcal.eventStore.clear()
+    async def fullSync():
+        gcal.syncEvents(guildConfig['calendar'])
+    await measure("gcal full sync", eventCount, fullSync, repeat, resetCalendar)
+
+    async def incrementalSync():
+        for _ in range(100):
+            gcal.syncEvents(guildConfig['calendar'])
+    await measure("gcal incremental sync", 100, incrementalSync, repeat)
+
+    async def listUpcoming():
+        list(gcal.iterUpcomingEvents(guildConfig['calendar']))
+    await measure("gcal iterUpcomingEvents", eventCount, listUpcoming, repeat)
+
+    # Fill the threads channel- one show embed per event, the rest chat messages
+    upcoming = list(gcal.iterUpcomingEvents(guildConfig['calendar']))
+    shows = []
+    for i in range(messageCount):
+        if i < len(upcoming):
+            message = fakes.FakeMessage(channel, [await bot.createShowEmbed(upcoming[i])])
+            message.thread = fakes.FakeThread(upcoming[i].summary)
+            shows.append(message)
+        else:
+            message = fakes.FakeMessage(channel, content=f"message {i}")
+        channel.messages.append(message)
+    random.Random(0).shuffle(channel.messages)
+
+    # Show index
+    async def buildIndex():
+        await bot.buildShowIndex(guildConfig)
+    await measure("buildShowIndex (channel scan)", messageCount, buildIndex, repeat)
+
+    async def searchThreads():
+        for _ in range(100):
+            await bot.searchThreads(channel.id)
+    await measure("searchThreads", 100, searchThreads, repeat)
+
+    # Needed volunteers
+    threads = await bot.searchThreads(channel.id)
+    async def neededVolunteers():
+        for thread in threads:
+            await bot.createNeededVolunteers(thread)
+    await measure("createNeededVolunteers", len(threads), neededVolunteers, repeat)
+
+    # Upcoming shows
+    async def clearUpcomingCache():
+        bot.upcomingFieldCache.pop(channel.id, None)
+    async def upcomingShows():
+        for i in range(0, len(upcoming), 15):
+            await bot.createUpcomingShows(channel.id, upcoming[i:i + 15])
+    await measure("createUpcomingShows (cold)", len(upcoming), upcomingShows, repeat, clearUpcomingCache)
+    await measure("createUpcomingShows (warm)", len(upcoming), upcomingShows, repeat)
+
+    # Signups- each run signs users up across every show, moves them to another role, then removes them
+    users = [fakes.FakeUser() for _ in range(10)]
+    async def flushEdits():
+        await asyncio.gather(*list(bot.queuedEmbedEdits.values()))
+    async def addUsers():
+        for message in shows:
+            for i, user in enumerate(users):
+                await bot.addUserToEmbed(message, 3 + i % 7, user)
+        await flushEdits()
+    async def moveUsers():
+        for message in shows:
+            for i, user in enumerate(users):
+                await bot.addUserToEmbed(message, 3 + (i + 1) % 7, user)
+        await flushEdits()
+    async def removeUsers():
+        for message in shows:
+            for user in users:
+                await bot.removeUserFromEmbed(user, message)
+        await flushEdits()
+    signupCount = len(shows) * len(users)
+    await measure("addUserToEmbed", signupCount, addUsers, repeat, removeUsers)
+    await measure("addUserToEmbed (role change)", signupCount, moveUsers, repeat, addUsers)
+    await measure("removeUserFromEmbed", signupCount, removeUsers, repeat, addUsers)
+
+    print(f"\n{channel.edits} show embed edits sent")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the bot's hot paths against in-memory fakes.")
+    parser.add_argument("--messages", type=int, default=5000, help="messages in the threads channel")
+    parser.add_argument("--events", type=int, default=500, help="upcoming calendar events")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark")
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.messages, arguments.events, arguments.repeat))
@@ -0,0 +1,361 @@
+"""
+FAKES
+
+In-memory stand-ins for the Discord and Google Calendar objects the bot uses, so its hot paths can be run offline.
+
+Only the attributes and methods the bot actually uses are faked. Every fake Discord call can be given a latency, to stand in for a REST round trip.
+"""
+
+import asyncio
+import configparser
+import datetime
+import itertools
+import os
+import sys
+import tempfile
+
+import discord
+
+# Fake Discord snowflakes
+snowflakes = itertools.count(10**17)
+
+class FakeUser:
+    """
+    Discord user or member.
+    """
+    def __init__(self, userID: int | None = None, roles: list[str] = ()):
+        self.id = userID if userID is not None else next(snowflakes)
+        self.roles = [FakeRole(name) for name in roles]
+
+class FakeRole:
+    """
+    Discord role. Only the name is used.
+    """
+    def __init__(self, name: str):
+        self.name = name
+
+class FakeGuild:
+    """
+    Discord guild. Members are looked up by id.
+    """
+    def __init__(self, guildID: int):
+        self.id = guildID
+        # User id -> FakeUser of every member
+        self.members = {}
+
+    def get_member(self, userID: int) -> FakeUser | None:
+        return self.members.get(userID)
+
+    async def query_members(self, user_ids: list[int], limit: int = 5, **kwargs) -> list[FakeUser]:
+        if len(user_ids) > 100:
+            raise ValueError("Too many user ids")
+        return [self.members[userID] for userID in user_ids if userID in self.members]
+
+class FakeThread:
+    """
+    Discord thread, counting membership calls.
+    """
+    def __init__(self, name: str, latency: float = 0):
+        self.id = next(snowflakes)
+        self.name = name
+        self.latency = latency
+        self.members = set()
+        self.addCalls = 0
+        self.removeCalls = 0
+        self.archived = False
+        self.locked = False
+
+    async def add_user(self, user: FakeUser) -> None:
+        self.addCalls += 1
+        await asyncio.sleep(self.latency)
+        self.members.add(user.id)
+
+    async def remove_user(self, user: FakeUser) -> None:
+        self.removeCalls += 1
+        await asyncio.sleep(self.latency)
+        self.members.discard(user.id)
+
+    async def edit(self, name: str | None = None, archived: bool | None = None, locked: bool | None = None, **kwargs) -> "FakeThread":
+        await asyncio.sleep(self.latency)
+        if name is not None:
+            self.name = name
+        if archived is not None:
+            self.archived = archived
+        if locked is not None:
+            self.locked = locked
+        return self
+
+class FakeMessage:
+    """
+    Discord message, counting edits.
+    """
+    def __init__(self, channel: "FakeChannel", embeds: list[discord.Embed] = (), content: str = ""):
+        self.id = next(snowflakes)
+        self.channel = channel
+        self.embeds = list(embeds)
+        self.content = content
+        self.thread = None
+        self.edits = 0
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/1/{self.channel.id}/{self.id}"
+
+    async def edit(self, embed: discord.Embed | None = None, **kwargs) -> "FakeMessage":
+        self.edits += 1
+        self.channel.edits += 1
+        await asyncio.sleep(self.channel.latency)
+        if embed is not None:
+            # Discord sends back what it stored, so keep a copy rather than the caller's object
+            self.embeds = [discord.Embed.from_dict(embed.to_dict())]
+        await self.channel.dispatchEdit(self)
+        return self
+
+    async def create_thread(self, name: str, **kwargs) -> FakeThread:
+        await asyncio.sleep(self.channel.latency)
+        self.thread = FakeThread(name, self.channel.latency)
+        return self.thread
+
+class FakeChannel:
+    """
+    Discord text channel. Messages are kept oldest first, like Discord stores them.
+    """
+    def __init__(self, latency: float = 0):
+        self.id = next(snowflakes)
+        self.guild = FakeGuild(1)
+        self.latency = latency
+        self.messages = []
+        self.sends = 0
+        self.edits = 0
+        # Gateway listeners, called with a raw message update payload after every edit
+        self.editListeners = []
+
+    async def dispatchEdit(self, message: "FakeMessage") -> None:
+        payload = FakeRawMessageUpdate(self.id, message.id, {"embeds": [embed.to_dict() for embed in message.embeds]})
+        for listener in self.editListeners:
+            await listener(payload)
+
+    async def history(self, limit: int | None = 100):
+        # Discord returns history newest first, 100 messages per request
+        for i, message in enumerate(reversed(self.messages)):
+            if limit is not None and i >= limit:
+                return
+            if i % 100 == 0:
+                await asyncio.sleep(self.latency)
+            yield message
+
+    async def send(self, embed: discord.Embed | None = None, view: discord.ui.View | None = None, **kwargs) -> FakeMessage:
+        self.sends += 1
+        await asyncio.sleep(self.latency)
+        message = FakeMessage(self, [discord.Embed.from_dict(embed.to_dict())] if embed else [])
+        self.messages.append(message)
+        return message
+
+    async def fetch_message(self, messageID: int) -> FakeMessage:
+        await asyncio.sleep(self.latency)
+        for message in self.messages:
+            if message.id == messageID:
+                return message
+        raise discord.NotFound(FakeResponse(404), "Unknown Message")
+
+class FakeRawMessageUpdate:
+    """
+    Gateway MESSAGE_UPDATE payload, as passed to on_raw_message_edit.
+    """
+    def __init__(self, channelID: int, messageID: int, data: dict):
+        self.guild_id = 1
+        self.channel_id = channelID
+        self.message_id = messageID
+        self.data = data
+
+class FakeInteractionResponse:
+    """
+    Discord interaction response. Records when the interaction was first responded to.
+    """
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self.respondedAt = None
+
+    async def respond(self) -> None:
+        if self.respondedAt is not None:
+            raise discord.InteractionResponded(self.interaction)
+        self.respondedAt = asyncio.get_running_loop().time()
+        await asyncio.sleep(self.interaction.latency)
+
+    async def send_message(self, content: str | None = None, **kwargs) -> None:
+        await self.respond()
+
+    async def defer(self, **kwargs) -> None:
+        await self.respond()
+
+    async def edit_message(self, **kwargs) -> None:
+        await self.respond()
+
+class FakeFollowup:
+    """
+    Discord interaction followup webhook.
+    """
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self.sent = []
+
+    async def send(self, content: str | None = None, **kwargs) -> None:
+        await asyncio.sleep(self.interaction.latency)
+        self.sent.append(content if content is not None else kwargs.get("embed"))
+
+class FakeInteraction:
+    """
+    Discord interaction, from a button press or a slash command.
+    """
+    def __init__(self, user: FakeUser, message: FakeMessage | None = None, latency: float = 0):
+        self.user = user
+        self.message = message
+        self.guild_id = 1
+        self.latency = latency
+        self.createdAt = asyncio.get_running_loop().time()
+        self.response = FakeInteractionResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def edit_original_response(self, **kwargs) -> None:
+        await asyncio.sleep(self.latency)
+
+class FakeResponse:
+    """
+    aiohttp response, just enough for discord.HTTPException.
+    """
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = ""
+
+class FakeRequest:
+    """
+    Google API request, returning a fixed response.
+    """
+    def __init__(self, response: dict):
+        self.response = response
+
+    def execute(self) -> dict:
+        return self.response
+
+class FakeEvents:
+    """
+    Google Calendar events resource. Full syncs page through every event, incremental syncs return no changes.
+    """
+    def __init__(self, events: list[dict], pageSize: int = 250):
+        self.events = events
+        self.pageSize = pageSize
+        self.listCalls = 0
+
+    def list(self, calendarId: str, pageToken: str | None = None, syncToken: str | None = None, **kwargs) -> FakeRequest:
+        self.listCalls += 1
+        if syncToken:
+            return FakeRequest({"items": [], "nextSyncToken": syncToken})
+        start = int(pageToken or 0)
+        response = {"items": self.events[start:start + self.pageSize]}
+        if start + self.pageSize < len(self.events):
+            response["nextPageToken"] = str(start + self.pageSize)
+        else:
+            response["nextSyncToken"] = "sync"
+        return FakeRequest(response)
+
+class FakeCalendarService:
+    """
+    Google Calendar service.
+    """
+    def __init__(self, events: list[dict], pageSize: int = 250):
+        self.eventsResource = FakeEvents(events, pageSize)
+
+    def events(self) -> FakeEvents:
+        return self.eventsResource
+
+def makeEvents(count: int, recurringEvery: int = 5) -> list[dict]:
+    """
+    Makes upcoming Google Calendar events, one a day starting tomorrow. Every recurringEvery-th event is part of a weekly recurring series.
+
+    Arguments:
+        Count - number of events.
+        RecurringEvery - how often an event is part of a recurring series, or 0 for none.
+
+    Returns: list[dict] - events, in the Google Calendar API format.
+    """
+    start = datetime.datetime.now(datetime.timezone.utc).replace(hour=20, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+    events = []
+    for i in range(count):
+        eventStart = start + datetime.timedelta(days=i)
+        event = {
+            "id": f"event{i}",
+            "etag": f'"{3000000000000000 + i}"',
+            "status": "confirmed",
+            "summary": f"Show {i}",
+            "start": {"dateTime": eventStart.isoformat()},
+            "end": {"dateTime": (eventStart + datetime.timedelta(hours=3)).isoformat()},
+        }
+        if recurringEvery and i % recurringEvery == 0:
+            event["recurringEventId"] = f"series{i % 7}"
+        events.append(event)
+    return events
+
+def importBot(databasePath: str = ":memory:", extraConfig: dict | None = None):
+    """
+    Imports main.py with a generated config.ini, without connecting to Discord.
+
+    Arguments:
+        DatabasePath - signup store database file.
+        ExtraConfig - extra config values, as a dict of section to dict of key to value.
+
+    Returns: the main module.
+    """
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    config.read_dict({
+        "CALENDAR": {"id": "benchmark@calendar"},
+        "DISCORD": {
+            "token": "benchmark",
+            "threadsChannel": "0",
+            "botAdminRole": "Admin",
+            "bookerEmoji": "📕",
+            "doorEmoji": "🚪",
+            "soundEmoji": "🔊",
+            "doorTrainingEmoji": "🚪",
+            "soundTrainingEmoji": "🔊",
+            "onCallEmoji": "📞",
+            "vendorEmoji": "🛍️",
+            "editWindow": "0",
+        },
+        "DATABASE": {"path": databasePath},
+    })
+    if extraConfig:
+        config.read_dict(extraConfig)
+
+    repoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if repoRoot not in sys.path:
+        sys.path.insert(0, repoRoot)
+
+    previousDirectory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "config.ini"), "w", encoding="utf-8") as configFile:
+            config.write(configFile)
+        os.chdir(directory)
+        try:
+            import main
+        finally:
+            os.chdir(previousDirectory)
+    return main
+
+def attachChannel(main, channel: FakeChannel) -> None:
+    """
+    Makes the bot use a fake channel as the default config's threads channel, and gives the default config to the channel's guild like on_ready does.
+
+    Arguments:
+        Main - the main module, from importBot.
+        Channel - fake threads channel.
+
+    Returns: None
+    """
+    # The default config isn't given to a guild until the bot connects
+    guildConfig = main.guildConfigs[None]
+    del main.channelConfigs[guildConfig['threadsChannel']]
+    guildConfig['threadsChannel'] = channel.id
+    main.channelConfigs[channel.id] = guildConfig
+    main.client.get_channel = lambda channelID: channel if channelID == channel.id else None
+    main.resolveDefaultGuild()
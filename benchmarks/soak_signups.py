@@ -0,0 +1,149 @@
+"""
+SIGNUP SOAK TEST
+
+Replays a signup storm against the bot through a local stand-in for Discord: fake REST calls with a set latency, and a fake gateway that sends message edits back to the bot like Discord does.
+
+Every user presses signup and remove buttons at random on random shows, all at once, while admins run /adduser for other users on the same shows. Once everything has settled, each show embed is checked against what the signups should be.
+
+Usage: python benchmarks/soak_signups.py [--shows 1] [--users 300] [--presses 3] [--addusers 50] [--latency 0.05] [--rate-limits] [--thread-member-events]
+
+Reports:
+    interaction latency - time from a button press or command to its first response, p50/p99 and how many took over Discord's 3 second limit
+    edits - show embed edits sent, and membership calls made
+    lost signups - users whose final role is missing from or wrong on the show embed
+    duplicated signups - users listed more than once on a show embed
+    thread mismatches - users whose thread membership doesn't match their signup
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import fakes
+
+async def main(showCount: int, userCount: int, presses: int, adduserCount: int, latency: float, rateLimits: bool, threadMemberEvents: bool, seed: int) -> None:
+    bot = fakes.importBot(extraConfig={"DISCORD": {"threadMemberEvents": "yes" if threadMemberEvents else "no"}})
+    import gcal
+    import outbound
+    import stats
+    from roster import mentionPattern
+
+    if not rateLimits:
+        # Measure the bot's own scheduling, not the time spent waiting out rate limits
+        outbound.bucketRates = {}
+
+    channel = fakes.FakeChannel(latency)
+    fakes.attachChannel(bot, channel)
+    channel.editListeners.append(bot.on_raw_message_edit)
+
+    # Post the shows
+    shows = []
+    for event in map(gcal.toShowEvent, fakes.makeEvents(showCount, recurringEvery=0)):
+        message = fakes.FakeMessage(channel, [await bot.createShowEmbed(event)])
+        message.thread = fakes.FakeThread(event.summary, latency)
+        channel.messages.append(message)
+        shows.append(message)
+    await bot.buildShowIndex(bot.getGuildConfig(channel.guild.id))
+
+    randomizer = random.Random(seed)
+    # (show id, user id) -> expected role, -1 if removed
+    expected = {}
+    latencies = []
+
+    async def respondLatency(interaction: fakes.FakeInteraction) -> None:
+        if interaction.response.respondedAt is not None:
+            latencies.append(interaction.response.respondedAt - interaction.createdAt)
+
+    async def volunteer(user: fakes.FakeUser) -> None:
+        # Presses from one user happen one after another, like a real user clicking
+        for _ in range(presses):
+            message = randomizer.choice(shows)
+            interaction = fakes.FakeInteraction(user, message, latency)
+            if randomizer.random() < 0.2:
+                await bot.ThreadView.removeButtonCallback(None, interaction, None)
+                expected[(message.id, user.id)] = -1
+            else:
+                role = randomizer.randrange(3, 10)
+                await bot.ThreadView.userSignUp(interaction, role)
+                expected[(message.id, user.id)] = role
+            await respondLatency(interaction)
+
+    admin = fakes.FakeUser(roles=["Admin"])
+    async def adduser(user: fakes.FakeUser) -> None:
+        message = randomizer.choice(shows)
+        role = randomizer.randrange(3, 10)
+        interaction = fakes.FakeInteraction(admin, None, latency)
+        await bot.adduser.callback(interaction, user, str(message.id), str(role))
+        expected[(message.id, user.id)] = role
+        await respondLatency(interaction)
+
+    volunteers = [fakes.FakeUser() for _ in range(userCount)]
+    assigned = [fakes.FakeUser() for _ in range(adduserCount)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*[volunteer(user) for user in volunteers], *[adduser(user) for user in assigned])
+    interactionsDone = time.perf_counter() - start
+
+    # Let queued edits and membership calls settle
+    while bot.queuedEmbedEdits or any(outbound.queueDepth.values()) or any(outbound.inFlight.values()):
+        await asyncio.gather(*list(bot.queuedEmbedEdits.values()))
+        await asyncio.sleep(0.01)
+    settled = time.perf_counter() - start
+
+    # Check every show embed against the expected signups
+    lost = duplicated = threadMismatches = 0
+    for message in shows:
+        fields = message.embeds[0].fields
+        listed = {}
+        for role in range(3, 10):
+            for userID in mentionPattern.findall(fields[role].value):
+                userID = int(userID)
+                if userID in listed:
+                    duplicated += 1
+                listed[userID] = role
+        for (showID, userID), role in expected.items():
+            if showID != message.id:
+                continue
+            if role == -1:
+                if userID in listed:
+                    lost += 1
+                if userID in message.thread.members:
+                    threadMismatches += 1
+            else:
+                if listed.get(userID) != role:
+                    lost += 1
+                if userID not in message.thread.members:
+                    threadMismatches += 1
+
+    latencies.sort()
+    def percentile(fraction: float) -> float:
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else 0.0
+
+    interactionCount = userCount * presses + adduserCount
+    addCalls = sum(message.thread.addCalls for message in shows)
+    removeCalls = sum(message.thread.removeCalls for message in shows)
+    print(f"{showCount} show(s), {userCount} users x {presses} presses, {adduserCount} /adduser calls, {latency * 1000:.0f} ms REST latency, rate limits {'on' if rateLimits else 'off'}\n")
+    print(f"interactions          {interactionCount} in {interactionsDone:.2f}s, settled after {settled:.2f}s")
+    print(f"interaction latency   p50 {percentile(0.50) * 1000:.1f} ms, p99 {percentile(0.99) * 1000:.1f} ms, max {percentile(1.0) * 1000:.1f} ms, over 3s {sum(value > 3 for value in latencies)}")
+    print(f"edits                 {channel.edits} show embed edits, {addCalls} add_user and {removeCalls} remove_user calls")
+    print(f"lost signups          {lost}")
+    print(f"duplicated signups    {duplicated}")
+    print(f"thread mismatches     {threadMismatches}")
+    print(f"unanswered            {interactionCount - len(latencies)}")
+    print(f"rate limit waits      {sum(outbound.bucketWaits.values())}")
+    for name, values in stats.summary().items():
+        print(f"span {name:<16} p50 {values['p50'] * 1000:.1f} ms, p99 {values['p99'] * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a signup storm against a local stand-in for Discord.")
+    parser.add_argument("--shows", type=int, default=1, help="show messages to spread the storm over")
+    parser.add_argument("--users", type=int, default=300, help="users pressing buttons at once")
+    parser.add_argument("--presses", type=int, default=3, help="button presses per user")
+    parser.add_argument("--addusers", type=int, default=50, help="/adduser calls made at the same time")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake REST call")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the outbound scheduler's rate limit buckets")
+    parser.add_argument("--thread-member-events", action="store_true", help="turn on threadMemberEvents, so the thread membership cache is used")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.shows, arguments.users, arguments.presses, arguments.addusers, arguments.latency, arguments.rate_limits, arguments.thread_member_events, arguments.seed))
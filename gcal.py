@@ -1,81 +1,453 @@
 import configparser
 
+import asyncio
+import concurrent.futures
+import dataclasses
 import datetime
+import json
+import operator
 import os.path
+import sys
+import tempfile
+import threading
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+# The rest of the Google API client is slow to import, so it's imported on first use by the worker threads
 from googleapiclient.errors import HttpError
 
 # Gcal scopes - read only access needed for app
 SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
 
-# Get all upcoming events on calendar specified as calendar_id
-def upcomingEvents(calID):
-  # Connect to Google Calendar
-  creds = None
+# Worker threads that run the blocking Google API calls, so the Discord event loop never waits on them
+executorWorkers = 4
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=executorWorkers, thread_name_prefix="gcal")
+
+# Make sure there are enough worker threads to sync this many calendars at once
+# Must be called before the first sync
+def resizeExecutor(calendarCount):
+  global executor, executorWorkers
+  if calendarCount > executorWorkers:
+    executor.shutdown(wait=False)
+    executorWorkers = calendarCount
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=executorWorkers, thread_name_prefix="gcal")
+
+# Each worker thread keeps its own long-lived service, as httplib2 connections can't be shared between threads
+threadLocal = threading.local()
+
+# Credential manager
+# Google credentials are loaded once and held in memory, shared by every worker thread
+# A background task refreshes them refreshMargin seconds before they expire, so syncs never wait on a token refresh
+# (a sync only refreshes the credentials itself if the background refresh failed)
+# token.json is only written when the credentials change, and is replaced atomically so a crash never leaves a half written token behind
+
+credentials = None
+credentialsLock = threading.Lock()
+
+# Credentials as last written to token.json
+savedToken = None
+
+# Refresh credentials this many seconds before they expire
+refreshMargin = 300
+
+# Seconds to wait before retrying a failed background refresh, and the longest wait between background checks
+refreshRetry = 60
+refreshCheckLimit = 3600
+
+# Background credential refresh task, started by startCredentialRefresh
+credentialRefreshTask = None
+
+# Write a file atomically- the new contents are written to a temporary file which then replaces the old file
+def writeFileAtomically(path, text):
+  directory = os.path.dirname(os.path.abspath(path))
+  fd, tempPath = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+  try:
+    with os.fdopen(fd, "w") as file:
+      file.write(text)
+      file.flush()
+      os.fsync(file.fileno())
+    os.replace(tempPath, path)
+  except BaseException:
+    if os.path.exists(tempPath):
+      os.remove(tempPath)
+    raise
+
+# Write the credentials to token.json if they changed since they were last written
+def saveCredentials():
+  global savedToken
+  token = credentials.to_json()
+  if token != savedToken:
+    writeFileAtomically("token.json", token)
+    savedToken = token
+
+# Seconds until the credentials expire
+def secondsUntilExpiry():
+  if credentials is None or credentials.expiry is None:
+    return float("inf")
+  # Credential expiry times are naive UTC
+  now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+  return (credentials.expiry - now).total_seconds()
+
+# Load Google credentials from token.json, refreshing them or asking for new ones interactively if needed
+def loadCredentials():
+  global credentials, savedToken
+  from google.auth.transport.requests import Request
+  from google.oauth2.credentials import Credentials
+  from google_auth_oauthlib.flow import InstalledAppFlow
   if os.path.exists("token.json"):
-    creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-  if not creds or not creds.valid:
-    if creds and creds.expired and creds.refresh_token:
-      creds.refresh(Request())
+    credentials = Credentials.from_authorized_user_file("token.json", SCOPES)
+    savedToken = credentials.to_json()
+  if not credentials or not credentials.valid:
+    if credentials and credentials.expired and credentials.refresh_token:
+      credentials.refresh(Request())
     else:
       flow = InstalledAppFlow.from_client_secrets_file(
           "gcal_creds.json", SCOPES
       )
-      creds = flow.run_local_server(port=0)
-    with open("token.json", "w") as token:
-      token.write(creds.to_json())
-  
-  try:
-    service = build("calendar", "v3", credentials=creds)
+      credentials = flow.run_local_server(port=0)
+    saveCredentials()
+
+# Get the Google credentials, loading them on first use
+# If they're invalid, or expire within margin seconds, they're refreshed first
+def getCredentials(margin=0):
+  with credentialsLock:
+    if credentials is None or (not credentials.valid and not credentials.refresh_token):
+      loadCredentials()
+    elif not credentials.valid or secondsUntilExpiry() <= margin:
+      from google.auth.transport.requests import Request
+      credentials.refresh(Request())
+      saveCredentials()
+    return credentials
+
+# Background task that keeps the credentials fresh, refreshing them refreshMargin seconds before they expire
+async def credentialRefreshLoop():
+  loop = asyncio.get_running_loop()
+  while True:
+    try:
+      await loop.run_in_executor(executor, getCredentials, refreshMargin)
+      delay = min(max(secondsUntilExpiry() - refreshMargin, refreshRetry), refreshCheckLimit)
+    except Exception as error:
+      print(f"An error occurred refreshing Google credentials: {error}")
+      delay = refreshRetry
+    await asyncio.sleep(delay)
+
+# Start the background credential refresh, if it isn't running already. The credentials are loaded straight away
+def startCredentialRefresh():
+  global credentialRefreshTask
+  if credentialRefreshTask is None:
+    credentialRefreshTask = asyncio.create_task(credentialRefreshLoop())
+
+# Calendar API discovery document, read once from the copy bundled with the Google API client and shared by every worker thread
+discoveryDocument = None
+discoveryLock = threading.Lock()
+
+# Get the Calendar API discovery document, or None if the Google API client doesn't bundle one
+def getDiscoveryDocument():
+  global discoveryDocument
+  with discoveryLock:
+    if discoveryDocument is None:
+      from googleapiclient.discovery_cache import get_static_doc
+      document = get_static_doc("calendar", "v3")
+      if document:
+        discoveryDocument = json.loads(document)
+    return discoveryDocument
+
+# Get the calendar service for the current worker thread, building it on first use
+def getService():
+  creds = getCredentials()
+  service = getattr(threadLocal, "service", None)
+  if service is None:
+    from googleapiclient.discovery import build, build_from_document
+    document = getDiscoveryDocument()
+    if document:
+      service = build_from_document(document, credentials=creds)
+    else:
+      # Fetch the discovery document from Google
+      service = build("calendar", "v3", credentials=creds, cache_discovery=False)
+    threadLocal.service = service
+  return service
+
+# Local copy of each calendar's events, keyed by calendar id and then by event id
+eventStore = {}
+
+# Token for the next incremental sync of each calendar
+syncTokens = {}
+
+# One sync at a time per calendar
+syncLocks = {}
+
+# Next occurrence mode- recurring events are downloaded once as their series (master) event, rather than as every expanded instance,
+# and only the next instance of each series is then fetched. Set from config before the first sync
+nextOccurrenceOnly = False
+
+# Next instance of each recurring series, keyed by calendar id and then by series event id (next occurrence mode only)
+nextInstances = {}
+
+# Partial response fields- only what ShowEvent holds, plus what's needed to follow pages and sync incrementally
+eventFields = "id,etag,status,summary,start,end,recurringEventId,recurrence"
+listFields = f"nextPageToken,nextSyncToken,items({eventFields})"
+instanceFields = f"items({eventFields})"
+
+# Compact, immutable record of an event, holding only what the bot uses
+# start and end are UNIX timestamps, parsed once when the event is synced
+@dataclasses.dataclass(frozen=True, slots=True)
+class ShowEvent:
+  id: str
+  etag: str
+  summary: str
+  start: float
+  end: float
+  # Id of the recurring series this event is an instance of, if any
+  seriesID: str | None = None
+  # True if this is the series event of a recurring event (next occurrence mode only)
+  isSeries: bool = False
 
-    # Google Calendar API Calls
-    now = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+# Make a ShowEvent from a Google Calendar event resource
+def toShowEvent(event):
+  return ShowEvent(
+      id=event["id"],
+      etag=event["etag"],
+      summary=event.get("summary", ""),
+      start=eventStart(event).timestamp(),
+      end=eventEnd(event).timestamp(),
+      seriesID=event.get("recurringEventId"),
+      isSeries="recurrence" in event,
+  )
+
+# Get the start of an event resource as an aware datetime
+def eventStart(event):
+  if 'dateTime' not in event['start']:
+    # All day event
+    return datetime.datetime.fromisoformat(event['start']['date']).astimezone()
+  return datetime.datetime.fromisoformat(event['start']['dateTime'])
+
+# Get the end of an event resource as an aware datetime
+def eventEnd(event):
+  if 'dateTime' not in event['end']:
+    # All day event
+    return datetime.datetime.fromisoformat(event['end']['date']).astimezone()
+  return datetime.datetime.fromisoformat(event['end']['dateTime'])
+
+# Days ahead each calendar's full syncs download events for, or None for no limit (see setSyncHorizon)
+syncHorizons = {}
+
+# End of the time window of each calendar's last full sync, in unix seconds, or None if the window has no end
+syncWindowEnds = {}
+
+# Set how many days ahead a calendar's events are listed, so its full syncs only download that far ahead
+# A calendar listed by several guilds uses the longest horizon, and no horizon (None) wins over any other
+def setSyncHorizon(calID, horizonDays):
+  current = syncHorizons.get(calID, horizonDays)
+  syncHorizons[calID] = None if current is None or horizonDays is None else max(current, horizonDays)
+
+# End of the first non-series event of each calendar's event store, for knowing when to drop ended events
+firstEventEnds = {}
+
+# Lazily yield every page of an events.list request, following nextPageToken
+def eventPages(service, request):
+  pageToken = None
+  while True:
     events_result = (
         service.events()
-        .list(
-            calendarId=calID,
-            timeMin=now,
-            singleEvents=True,
-            orderBy="startTime"
-        )
+        .list(pageToken=pageToken, **request)
         .execute()
     )
+    yield events_result
+    pageToken = events_result.get("nextPageToken")
+    if not pageToken:
+      break
 
+# Download changes to a calendar and apply them to the event store
+def applySync(calID):
+  service = getService()
+  syncToken = syncTokens.get(calID)
+  horizonDays = syncHorizons.get(calID)
+  syncTime = datetime.datetime.now(tz=datetime.timezone.utc)
+  windowEnd = syncWindowEnds.get(calID)
 
+  singleEvents = not nextOccurrenceOnly
 
-    # Parse upcoming events
-    events = events_result.get("items", [])
+  if syncToken and windowEnd is not None and (horizonDays is None or syncTime.timestamp() + horizonDays * 86400 > windowEnd):
+    # Incremental syncs only return events that changed, so events past the last full sync's window would never be downloaded- start over
+    syncToken = None
 
-    # deduplicate events based on recurringEventId (so that only the next recurrence is returned)
-    invalidRecurrenceIds = []
-    output = []
-    for event in events:
-      # if no recurrengEventId is listed, then we can just get out of this iteration and copy event to output
-      if not "recurringEventId" in event:
-        output.append(event)
+  if syncToken:
+    request = {"calendarId": calID, "singleEvents": singleEvents, "syncToken": syncToken, "fields": listFields}
+  else:
+    # Full sync, of upcoming events only
+    request = {"calendarId": calID, "singleEvents": singleEvents, "timeMin": syncTime.isoformat(), "fields": listFields}
+    windowEnd = None
+    if horizonDays is not None:
+      # Download twice the horizon, so the next full sync is only needed once a horizon's worth of days has passed
+      windowEnd = (syncTime + datetime.timedelta(days=2 * horizonDays)).timestamp()
+      request["timeMax"] = datetime.datetime.fromtimestamp(windowEnd, tz=datetime.timezone.utc).isoformat()
+
+  changes = []
+  for events_result in eventPages(service, request):
+    changes.extend(events_result.get("items", []))
+
+  # Changes are applied to a copy which then replaces the old store, so readers never see a half applied sync
+  store = eventStore.get(calID, {})
+  if syncToken and not changes:
+    changed = False
+  else:
+    store = dict(store) if syncToken else {}
+    for event in changes:
+      if event.get("status") == "cancelled":
+        store.pop(event["id"], None)
       else:
-        # else, event is part of a recurrence
-        # first, check if recurrence id is already in list
-        if not event['recurringEventId'] in invalidRecurrenceIds:
-            # first found occurence of event
-            invalidRecurrenceIds.append(event['recurringEventId'])
-            # append to output
-            output.append(event)
-
-# Prints out upcoming events, but not needed atm
-    return output
-
-#    if not events:
-#      print("No upcoming events found.")
-#      return
-#
-#    for event in events:
-#      start = event["start"].get("dateTime", event["start"].get("date"))
-#      print(event["etag"], start, event["summary"])
-
-  except HttpError as error:
-    print(f"An error occurred: {error}")
\ No newline at end of file
+        store[event["id"]] = toShowEvent(event)
+    changed = True
+
+  # Drop events that are over, so the store only holds upcoming events
+  # Series events are kept, as their start and end are those of the first instance
+  # The store is only scanned when it changed or its first event has ended
+  now = datetime.datetime.now(tz=datetime.timezone.utc).timestamp()
+  endedIDs = []
+  if changed or now >= firstEventEnds.get(calID, 0):
+    endedIDs = [eventID for eventID, event in store.items() if event.end <= now and not event.isSeries]
+    firstEventEnds[calID] = min((event.end for event in store.values() if event.end > now and not event.isSeries), default=float("inf"))
+  if endedIDs:
+    if not changed:
+      store = dict(store)
+    for eventID in endedIDs:
+      del store[eventID]
+  if changed or endedIDs:
+    eventStore[calID] = store
+  if nextOccurrenceOnly:
+    changed = applyNextInstances(service, calID, changes, not syncToken) or changed
+  syncTokens[calID] = events_result.get("nextSyncToken")
+  syncWindowEnds[calID] = windowEnd
+  return changed
+
+# Fetch the next instance of every recurring series that changed, or whose next instance is over (next occurrence mode only)
+# Returns True if any next instance changed
+def applyNextInstances(service, calID, changes, fullSync):
+  now = datetime.datetime.now(tz=datetime.timezone.utc)
+  store = eventStore.get(calID, {})
+  current = {} if fullSync else nextInstances.get(calID, {})
+
+  if fullSync:
+    seriesIDs = {eventID for eventID, event in store.items() if event.isSeries}
+  else:
+    seriesIDs = set()
+    for event in changes:
+      if "recurrence" in event or event["id"] in current:
+        # Series event was added, edited, or cancelled
+        seriesIDs.add(event["id"])
+      elif "recurringEventId" in event:
+        # A single instance of a series was edited or cancelled
+        seriesIDs.add(event["recurringEventId"])
+    seriesIDs.update(seriesID for seriesID, instance in current.items() if instance.end <= now.timestamp())
+  if not seriesIDs and not fullSync:
+    return False
+
+  # Changes are applied to a copy, like the event store
+  updated = dict(current)
+  for seriesID in seriesIDs:
+    series = store.get(seriesID)
+    if series is None or not series.isSeries:
+      # Series was cancelled
+      updated.pop(seriesID, None)
+      continue
+    items = (
+        service.events()
+        .instances(calendarId=calID, eventId=seriesID, timeMin=now.isoformat(), maxResults=1, fields=instanceFields)
+        .execute()
+        .get("items", [])
+    )
+    if items:
+      updated[seriesID] = toShowEvent(items[0])
+    else:
+      # Series has no more instances
+      updated.pop(seriesID, None)
+  nextInstances[calID] = updated
+  return True
+
+# Blocking sync of a calendar into the event store - only ever ran on an executor thread
+# The first sync downloads every upcoming event within the calendar's horizon (see setSyncHorizon), later syncs only download what changed since the last one
+# Returns True if the event store changed
+def syncEvents(calID):
+  with syncLocks.setdefault(calID, threading.Lock()):
+    try:
+      return applySync(calID)
+    except HttpError as error:
+      if error.resp.status == 410 and syncTokens.get(calID):
+        # Sync token expired, start over with a full sync
+        syncTokens.pop(calID, None)
+        return applySync(calID)
+      raise
+
+# Lazily yield upcoming events from the event store, in start order
+# If horizonDays is given, only events starting within that many days are yielded
+def iterUpcomingEvents(calID, horizonDays=None):
+  now = datetime.datetime.now(tz=datetime.timezone.utc).timestamp()
+  if nextOccurrenceOnly:
+    # Single events, then the next instance of each recurring series
+    candidates = [event for event in eventStore.get(calID, {}).values() if not event.isSeries and event.seriesID is None]
+    candidates.extend(nextInstances.get(calID, {}).values())
+  else:
+    candidates = eventStore.get(calID, {}).values()
+  events = [event for event in candidates if event.end > now]
+  if horizonDays is not None:
+    horizon = now + horizonDays * 86400
+    events = [event for event in events if event.start < horizon]
+  events.sort(key=operator.attrgetter("start"))
+
+  # deduplicate events based on recurringEventId (so that only the next recurrence is returned)
+  invalidRecurrenceIds = set()
+  for event in events:
+    # if no recurrengEventId is listed, then we can just get out of this iteration and copy event to output
+    if event.seriesID is None:
+      yield event
+    else:
+      # else, event is part of a recurrence
+      # first, check if recurrence id is already in set
+      if not event.seriesID in invalidRecurrenceIds:
+          # first found occurence of event
+          invalidRecurrenceIds.add(event.seriesID)
+          yield event
+
+# Number of syncs that changed each calendar's event store, for callers caching anything built from it
+storeVersions = {}
+
+# Event loop time of each calendar's last successful sync
+lastSynced = {}
+
+# Errors a failed sync can raise: Google API errors, auth and transport errors, and network errors
+# The auth and transport libraries are only imported by the worker threads (see getService), so their errors can't be raised before they're imported
+def syncErrors():
+  errors = [HttpError, OSError]
+  authExceptions = sys.modules.get("google.auth.exceptions")
+  if authExceptions is not None:
+    errors.append(authExceptions.GoogleAuthError)
+  httplib2 = sys.modules.get("httplib2")
+  if httplib2 is not None:
+    errors.append(httplib2.HttpLib2Error)
+  return tuple(errors)
+
+# Sync a calendar into the event store without blocking the event loop
+# If the calendar was synced less than maxAge seconds ago, the sync is skipped
+# Returns False if the sync failed
+async def refreshEvents(calID, maxAge=0):
+  loop = asyncio.get_running_loop()
+  if calID in lastSynced and loop.time() - lastSynced[calID] < maxAge:
+    return True
+  try:
+    if await loop.run_in_executor(executor, syncEvents, calID):
+      storeVersions[calID] = storeVersions.get(calID, 0) + 1
+    lastSynced[calID] = loop.time()
+    return True
+  except syncErrors() as error:
+    # Serve the last synced events if the sync fails
+    print(f"An error occurred: {error}")
+    return False
+
+# Yield all upcoming events on calendar specified as calendar_id without blocking the event loop
+# The whole sync finishes before the first event is yielded- events are then yielded from the local event store
+async def streamUpcomingEvents(calID, horizonDays=None, maxAge=0):
+  await refreshEvents(calID, maxAge)
+  for event in iterUpcomingEvents(calID, horizonDays):
+    yield event
+
+# Get all upcoming events on calendar specified as calendar_id as a list
+async def upcomingEvents(calID, horizonDays=None):
+  return [event async for event in streamUpcomingEvents(calID, horizonDays)]
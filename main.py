@@ -1,9 +1,20 @@
 # Imports
+import asyncio
 import configparser
+import csv
 import discord
 import gcal
+import outbound
 import datetime
+import hashlib
+import io
+import json
+import random
 import re
+import signups
+import staffing
+import stats
+from roster import ShowRoster
 
 # Configuration Parsing
 config = configparser.ConfigParser()
@@ -12,14 +23,8 @@ config.read('config.ini', encoding='utf-8')
 # Discord bot token
 botToken = config['DISCORD']['token']
 
-# Channel to post show threads
-threadsChannel = config['DISCORD']['threadsChannel']
-
-# Search limit for finding threads
-searchLimit = config['DISCORD']['searchLimit']
-
-# Administrator role name
-botAdminRole = config['DISCORD']['botAdminRole']
+# Default administrator role name, for guilds that don't set their own
+botAdminRole = config.get('DISCORD', 'botAdminRole', fallback=None)
 
 # Emojis
 bookerEmoji = config['DISCORD']['bookerEmoji']
@@ -30,14 +35,154 @@ soundTrainingEmoji = config['DISCORD']['soundTrainingEmoji']
 onCallEmoji = config['DISCORD']['onCallEmoji']
 vendorEmoji = config['DISCORD']['vendorEmoji']
 
-# Google Calendar id 
-calendar_id = config['CALENDAR']['id']
+# Default number of days ahead to look for events, for guilds that don't set their own (unlimited if not set)
+horizonDays = config.getint('CALENDAR', 'horizonDays', fallback=None)
+
+# Seconds to wait and merge signup changes into one show embed edit
+editWindow = config['DISCORD'].getfloat('editWindow', fallback=0.5)
+
+# Number of show threads /threads creates at once
+threadCreationLimit = config['DISCORD'].getint('threadCreationLimit', fallback=4)
+
+# Seconds between progress updates for long running commands
+progressInterval = 2
+
+# Signup store database file
+signupDatabase = config.get('DATABASE', 'path', fallback='signups.db')
+signups.openStore(signupDatabase)
+
+# Seconds between background calendar syncs (background syncing is off if not set)
+syncInterval = config.getfloat('CALENDAR', 'syncInterval', fallback=0)
+
+# Longest wait between background calendar syncs while they're failing
+maxSyncBackoff = 3600
+
+# Create show threads for new events on every background calendar sync
+autoThreads = config['DISCORD'].getboolean('autoThreads', fallback=False)
+
+# Minimum seconds between calendar syncs for /upcoming
+syncMaxAge = config.getfloat('CALENDAR', 'syncMaxAge', fallback=30)
+
+# Port for the local Prometheus metrics endpoint (off if not set)
+metricsPort = config.getint('STATS', 'port', fallback=0)
+
+# Only fetch the next occurrence of recurring events, rather than every instance
+gcal.nextOccurrenceOnly = config.getboolean('CALENDAR', 'nextOccurrenceOnly', fallback=False)
+
+# Keep the thread membership cache up to date from thread member events (needs the privileged members intent)
+threadMemberEvents = config.getboolean('DISCORD', 'threadMemberEvents', fallback=False)
+
+# Number of gateway shards (Discord's recommended count if not set)
+shardCount = config.getint('DISCORD', 'shardCount', fallback=None)
+
+# Staffing rules of each show type (see staffing.py)
+staffingRules = staffing.StaffingRules.fromConfig(config['STAFFING'] if config.has_section('STAFFING') else {})
+
+# Hours after a show starts to archive it (archiving is off if not set)
+archiveAfterHours = config.getfloat('DISCORD', 'archiveAfterHours', fallback=0)
+
+# Seconds between background archive runs
+archiveInterval = 3600
+
+"""
+GUILDS
+
+Each guild the bot serves has its own google calendar, threads channel, and bot admin role. 
+A guild is set up with a [GUILD <guild id>] section holding calendar and threadsChannel, and optionally botAdminRole and horizonDays. 
+The [CALENDAR] id and [DISCORD] threadsChannel settings, if set, make up the default config. It belongs to the guild its threads channel is in, which is looked up once the bot connects (see resolveDefaultGuild)- guilds without a config of their own can't use the bot. 
+"""
+
+# Guild id -> guild config (see addGuildConfig). The None key holds the default config until its guild is resolved
+guildConfigs = {}
+
+# Threads channel id -> guild config of the channel
+channelConfigs = {}
+
+def addGuildConfig(guildID: int | None, calendarID: str, channelID: int, adminRole: str, horizon: int | None) -> dict:
+    """
+    Adds a guild's config. 
+
+    Arguments:
+        GuildID - Discord guild id, or None for the default config
+        CalendarID - Google calendar id of the guild's events
+        ChannelID - Discord channel id to post the guild's show threads in
+        AdminRole - Name of the guild's bot admin role
+        Horizon - Number of days ahead to look for events, or None for unlimited
+
+    Returns: dict of the following:
+        guild: Discord guild id, or None for the default config
+        calendar: Google calendar id
+        threadsChannel: Discord threads channel id
+        botAdminRole: Bot admin role name
+        horizonDays: Days ahead to look for events, or None
+    """
+    guildConfig = {
+        "guild": guildID,
+        "calendar": calendarID,
+        "threadsChannel": channelID,
+        "botAdminRole": adminRole,
+        "horizonDays": horizon,
+    }
+    guildConfigs[guildID] = guildConfig
+    channelConfigs[channelID] = guildConfig
+    return guildConfig
+
+def getGuildConfig(guildID: int | None) -> dict | None:
+    """
+    Gets a guild's config. 
+
+    Arguments:
+        GuildID - Discord guild id, or None outside of a guild
+
+    Returns: dict - guild config (see addGuildConfig), or None if the guild isn't set up. 
+    """
+    if guildID is None:
+        return None
+    return guildConfigs.get(guildID)
+
+def resolveDefaultGuild() -> None:
+    """
+    Gives the default config to the guild its threads channel is in. If the channel can't be found, or its guild has its own config, the default config is dropped. 
+
+    Returns: None
+    """
+    guildConfig = guildConfigs.pop(None, None)
+    if guildConfig is None:
+        return
+    channel = client.get_channel(guildConfig['threadsChannel'])
+    if channel is None:
+        print(f"Threads channel {guildConfig['threadsChannel']} of the default config wasn't found- the default config is ignored.")
+    elif channel.guild.id in guildConfigs:
+        print(f"Guild {channel.guild.id} has its own config- the default config is ignored.")
+    else:
+        guildConfig['guild'] = channel.guild.id
+        guildConfigs[channel.guild.id] = guildConfig
+        return
+    if channelConfigs.get(guildConfig['threadsChannel']) is guildConfig:
+        del channelConfigs[guildConfig['threadsChannel']]
+
+if config.has_option('CALENDAR', 'id') and config.has_option('DISCORD', 'threadsChannel'):
+    addGuildConfig(None, config['CALENDAR']['id'], int(config['DISCORD']['threadsChannel']), botAdminRole, horizonDays)
+for section in config.sections():
+    if section.startswith('GUILD '):
+        addGuildConfig(int(section[6:]),
+                       config[section]['calendar'],
+                       config[section].getint('threadsChannel'),
+                       config[section].get('botAdminRole', botAdminRole),
+                       config[section].getint('horizonDays', fallback=horizonDays))
+
+# Every calendar can be synced at once, so a slow calendar never holds up the others
+gcal.resizeExecutor(len({guildConfig['calendar'] for guildConfig in guildConfigs.values()}))
+for guildConfig in guildConfigs.values():
+    gcal.setSyncHorizon(guildConfig['calendar'], guildConfig['horizonDays'])
 
 # Set up needed objects for Discord
 intents = discord.Intents.default()
 intents.message_content = True
-client = discord.Client(intents=intents)
+intents.members = threadMemberEvents
+client = discord.AutoShardedClient(intents=intents, shard_count=shardCount)
 tree = discord.app_commands.CommandTree(client)
+stats.watchRateLimits()
 
 """
 WHAT ARE SHOW POSTS, EMBEDS, AND THREADS
@@ -64,9 +209,59 @@ ON CALL : 8
 VENDOR : 9
 """
 
-async def addUserToThread(message: discord.Message, user: discord.User) -> None:
+# Show role -> name of the show role, as used by commands
+showRoleNames = {
+    3: "Booker",
+    4: "Door",
+    5: "Sound",
+    6: "Door Training",
+    7: "Sound Training",
+    8: "On Call",
+    9: "Vendor",
+}
+
+"""
+THREAD MEMBERSHIP
+
+Show thread membership is cached, so signups and removals skip add_user and remove_user calls that wouldn't change anything- such as a user switching show roles. 
+The cache holds users the bot added or removed itself, and joins and leaves from thread member events. Thread member events are only sent with the privileged members intent, which is turned on by threadMemberEvents. 
+Without thread member events, the bot never sees users leave or join a thread on their own, so the cache could be wrong- it's only used when threadMemberEvents is on. Otherwise, and for users the cache doesn't know about, users are always added or removed. 
+"""
+
+# Thread id -> user id -> true if the user is in the thread, false if they aren't
+threadMembers = {}
+
+def isThreadMember(threadID: int, userID: int) -> bool | None:
+    """
+    Checks the thread membership cache for a user. 
+
+    Arguments:
+        ThreadID - Discord thread id
+        UserID - Discord user id
+
+    Returns: bool - true if the user is in the thread, false if they aren't, or None if it isn't known (always None when threadMemberEvents is off). 
+    """
+    if not threadMemberEvents:
+        return None
+    return threadMembers.get(threadID, {}).get(userID)
+
+def setThreadMember(threadID: int, userID: int, isMember: bool) -> None:
+    """
+    Records a user joining or leaving a thread in the thread membership cache. 
+
+    Arguments:
+        ThreadID - Discord thread id
+        UserID - Discord user id
+        IsMember - true if the user is now in the thread, false if they aren't
+
+    Returns: None
+    """
+    if threadMemberEvents:
+        threadMembers.setdefault(threadID, {})[userID] = isMember
+
+async def addUserToThread(message: discord.Message, user: discord.abc.Snowflake) -> None:
         """
-        Adds the user to a show thread.
+        Adds the user to a show thread, unless they're already in it. 
 
         Arguments: 
             Message - Discord.py message to add user to. This is the base of the thread- typically it's a show embed. 
@@ -75,11 +270,128 @@ async def addUserToThread(message: discord.Message, user: discord.User) -> None:
         Returns: None
         """
         thread = message.thread
-        await thread.add_user(user)
+        if isThreadMember(thread.id, user.id):
+            return
+        await outbound.submit(outbound.USER, f"thread:{thread.id}", thread.add_user(user))
+        setThreadMember(thread.id, user.id, True)
+
+async def removeUserFromThread(message: discord.Message, user: discord.abc.Snowflake) -> None:
+        """
+        Removes the user from a show thread, unless they're known not to be in it. 
+
+        Arguments: 
+            Message - Discord.py message to remove user from. This is the base of the thread- typically it's a show embed. 
+            User - Discord.py user that's being removed from a thread 
+
+        Returns: None
+        """
+        thread = message.thread
+        if isThreadMember(thread.id, user.id) is False:
+            return
+        await outbound.submit(outbound.USER, f"thread:{thread.id}", thread.remove_user(user))
+        setThreadMember(thread.id, user.id, False)
+
+# Message id -> ShowRoster of the show embed, loaded on first use
+rosters = {}
+
+def getShowRoster(message: discord.Message) -> ShowRoster:
+    """
+    Gets the roster of a show embed. The roster is loaded from the signup store the first time it's needed. Shows that aren't in the signup store yet are parsed from their embed once and added to it- after that, the signup store is the source of truth.
+
+    Arguments:
+        Message - Discord.py message of the show embed.
+
+    Returns: ShowRoster - Roster of the show.
+    """
+    return loadShowRoster(message.id, message.embeds[0])
+
+def loadShowRoster(messageID: int, embed: discord.Embed) -> ShowRoster:
+    """
+    Gets the roster of a show embed by its message id, for when only the show index entry is at hand (see getShowRoster). 
+
+    Arguments:
+        MessageID - Discord message id of the show embed.
+        Embed - the show embed, parsed if the show isn't in the signup store yet.
+
+    Returns: ShowRoster - Roster of the show.
+    """
+    roster = rosters.get(messageID)
+    if roster is None:
+        if signups.isShowTracked(messageID):
+            roster = ShowRoster.fromSignups(signups.getSignups(messageID))
+        else:
+            roster = ShowRoster.fromEmbed(embed)
+            signups.trackShow(messageID, roster.toSignups())
+        rosters[messageID] = roster
+    return roster
+
+def renderShowEmbed(message: discord.Message) -> discord.Embed:
+    """
+    Renders a show embed's signup count and show role fields from its roster. All other fields are kept as they are- they're taken from the show index when the show is in it, so a render never undoes an event update made after the message was fetched.
+
+    Arguments:
+        Message - Discord.py message of the show embed.
+
+    Returns: discord.Embed - Rendered show embed.
+    """
+    foundThread = showIndex.get(message.channel.id, {}).get(showIndexMessages.get(message.id))
+    embed = foundThread['embed'] if foundThread else message.embeds[0]
+    return getShowRoster(message).renderInto(embed)
+
+"""
+SHOW EMBED EDITS
+
+Signup changes are written to the signup store straight away, and the show embed edit is queued. 
+Each show embed has at most one queued edit- every signup change made within editWindow seconds of the first is merged into it, and it's rendered from the signup store right before it's sent. 
+Edits to the same show embed are sent one at a time, so an older render can never overwrite a newer one. 
+"""
+
+# Message id -> queued edit task
+queuedEmbedEdits = {}
+
+# Message id -> lock held while an edit is being sent
+embedEditLocks = {}
+
+def queueShowEmbedEdit(message: discord.Message) -> asyncio.Task:
+    """
+    Queues an edit of a show embed, merging it with an already queued edit if there is one. 
+
+    Arguments:
+        Message - Discord.py message of the show embed.
+
+    Returns: asyncio.Task - task that sends the edit. 
+    """
+    task = queuedEmbedEdits.get(message.id)
+    if task is None:
+        task = asyncio.create_task(sendShowEmbedEdit(message))
+        queuedEmbedEdits[message.id] = task
+    return task
+
+async def sendShowEmbedEdit(message: discord.Message) -> None:
+    """
+    Sends a queued show embed edit once the edit window is over, and after any edit already being sent. 
+
+    Arguments:
+        Message - Discord.py message of the show embed.
+
+    Returns: None
+    """
+    lock = embedEditLocks.setdefault(message.id, asyncio.Lock())
+    async with lock:
+        await asyncio.sleep(editWindow)
+        # Signup changes from here on need a new edit
+        queuedEmbedEdits.pop(message.id, None)
+        try:
+            with stats.span("embed.edit"):
+                await outbound.submit(outbound.USER, f"channel:{message.channel.id}", message.edit(embed=renderShowEmbed(message)))
+        except discord.HTTPException as error:
+            print(f"An error occurred editing show embed {message.id}: {error}")
+    if not lock.locked() and message.id not in queuedEmbedEdits:
+        embedEditLocks.pop(message.id, None)
 
 async def addUserToEmbed(message: discord.Message, slot: int, user: discord.User) -> None:
     """
-    Adds the user to the show embed. This function edits the embed to add the user onto it. 
+    Adds the user to the show embed. If the user already has a role on the show, they are moved to the new role. An edit re-rendering the embed from the signup store is then queued. 
 
     Arguments:
         Message - Discord.py message to add the user to. For this function, we assume it's a show thread message.
@@ -88,24 +400,11 @@ async def addUserToEmbed(message: discord.Message, slot: int, user: discord.User
 
     Returns: None
     """
-    # get embed
-    embed = message.embeds[0]
-    # temporarily store embed into dictionary 
-    embedDict = embed.to_dict()
-    
-    # check if user exists in embed, and if they do remove them from the old role
-    if not await getUserCurrentRole(user, message) == -1:
-        await removeUserFromEmbed(user, message)
-
-    #recalculate and change count of users 
-    currentCount = int(re.search(r'\d+', embed.fields[0].value).group())
-    currentCount += 1
-    # change fields
-    embedDict['fields'][0]['value'] = f":busts_in_silhouette: {currentCount}"
-    embedDict['fields'][slot]['value'] = embedDict['fields'][slot]['value'] + f"\n<@{user.id}>"
-    # send new embed for edit
-    newEmbed = discord.Embed.from_dict(embedDict)
-    await message.edit(embed=newEmbed)
+    getShowRoster(message).move(user.id, slot)
+    signups.setRole(message.id, user.id, slot)
+    updateShowNeeds(message)
+    invalidateUpcomingShow(message.channel.id, showIndexMessages.get(message.id))
+    queueShowEmbedEdit(message)
     
 async def getUserCurrentRole(user: discord.User, message: discord.Message) -> int:
     """
@@ -117,17 +416,7 @@ async def getUserCurrentRole(user: discord.User, message: discord.Message) -> in
 
     Returns: int - show role id or -1 if user is not currently signed up.  
     """
-    embed = message.embeds[0]
-    fields = embed.fields
-    currentField = 0
-    for field in fields:
-        if str(user.id) in field.value:
-            # User is listed in current field
-            return currentField
-        else:
-            currentField += 1
-    # User not found
-    return -1
+    return getShowRoster(message).roleOf(user.id)
 
 async def removeUserFromEmbed(user: discord.User, message: discord.Message) -> None:
     """
@@ -139,114 +428,358 @@ async def removeUserFromEmbed(user: discord.User, message: discord.Message) -> N
 
     Returns: None
     """
-    embed = message.embeds[0]
-    fields = embed.fields
-    embedDict = embed.to_dict()
-    
-    targetField = await getUserCurrentRole(user, message)
-
-    if not targetField == -1:
-        # decrement signups
-        currentCount = int(re.search(r'\d+', embed.fields[0].value).group())
-        currentCount -= 1
-        # change fields
-        embedDict['fields'][0]['value'] = f":busts_in_silhouette: {currentCount}"
-        
-        # evil regex fuckery to remove user from role
-        newValue = re.sub(f"<@{user.id}>(\\n)?", "", embedDict['fields'][targetField]['value'])
-        embedDict['fields'][targetField]['value'] = newValue
-
-        # send new embed for edit
-        newEmbed = discord.Embed.from_dict(embedDict)
-        await message.edit(embed=newEmbed)
-
-async def isUserBotAdmin(user: discord.User) -> bool:
+    if not getShowRoster(message).remove(user.id) == -1:
+        signups.removeUser(message.id, user.id)
+        updateShowNeeds(message)
+        invalidateUpcomingShow(message.channel.id, showIndexMessages.get(message.id))
+        # queue new embed for edit
+        queueShowEmbedEdit(message)
+
+async def isUserBotAdmin(user: discord.User, guildConfig: dict) -> bool:
     """
-    Checks if the user has the bot admin role as specified in config file. 
+    Checks if the user has the guild's bot admin role as specified in config file. 
 
     Arguments-
         user: discord.py user object to check
+        guildConfig: guild config of the guild the user is in (see addGuildConfig)
 
     Returns - true if user has the specified bot administrator role, false otherwise. 
     """
 
     userRoles = [role.name for role in user.roles]
-    if botAdminRole in userRoles:
+    if guildConfig['botAdminRole'] in userRoles:
         # user is a bot admin
         return True
     else: 
         # user is not a bot admin
         return False
 
-async def searchThreads() -> list[dict]:
+async def getInteractionGuildConfig(interaction: discord.Interaction) -> dict | None:
     """
-    Searches threads channel for show embeds. 
+    Gets the config of the guild an interaction came from. If the guild isn't set up, the interaction is responded to saying so. 
 
-    Returns: list[dict] of the following for each found embed:
+    Arguments:
+        Interaction - Discord.py interaction information
+
+    Returns: dict - guild config (see addGuildConfig), or None if the guild isn't set up. 
+    """
+    guildConfig = getGuildConfig(interaction.guild_id)
+    if guildConfig is None:
+        await outbound.submit(outbound.INTERACTION, None, interaction.response.send_message("This server isn't set up for the bot.", ephemeral=True))
+    return guildConfig
+
+"""
+SHOW INDEX
+
+The show index maps each event's google calendar event id to its show embed, separately for each threads channel. 
+An event's id never changes, so an edited event is still matched to its show embed- unlike its ETAG, which changes on every edit. Show embeds posted before event ids were added to them are keyed by their ETAG instead, until /threads adds the event id (see findShow).
+It's built once from each threads channel's history when the bot first connects, and is then kept up to date from message events, so looking up a show never needs to call Discord- reconnecting never reads the history again. 
+"""
+
+# Threads channel id -> show key (event id, or ETAG for older show embeds) -> show embed information (see parseShowEmbed)
+showIndex = {}
+
+# Threads channel id -> event set once the channel's show index is built, or building it failed
+showIndexReady = {}
+
+# Threads channel id -> message id -> show embed information (or None if it's no longer a show embed), for messages indexed or unindexed while the channel's show index is being built
+# Message events are newer than the history read by the build, so they're applied on top of it
+showIndexChanges = {}
+
+# Message id -> show key of the show embed, for removing edited and deleted messages from the index
+showIndexMessages = {}
+
+# Matches the Discord timestamp of a show embed's start date field
+showStartPattern = re.compile(r"<t:(\d+):")
+
+def parseShowEmbed(messageID: int, url: str, embeds: list[discord.Embed]) -> dict | None:
+    """
+    Reads show embed information from a message's embeds. 
+
+    Arguments:
+        MessageID - Discord message id 
+        Url - Discord jump URL to the message
+        Embeds - the message's embeds
+
+    Returns: dict of the following, or None if the message isn't a show embed:
         etag: Event's google calendar ETAG
+        eventID: Event's google calendar event id, or None for show embeds posted before it was added
         summary: Event summary
         url: Discord jump URL to embed
         fields: Embed fields (used for needed volunteers)
+        embed: The show embed
+        start: Start of the show in unix seconds, or None if it can't be read
+        id: Discord message id of embed
+    """
+    for searchEmbed in embeds:
+        for field in searchEmbed.fields:
+            if "Calendar ID:" in field.value:
+                eventETAG = eventID = None
+                for line in field.value.splitlines():
+                    if line.startswith("Calendar ID: "):
+                        eventETAG = line[13:]
+                    elif line.startswith("Event ID: "):
+                        eventID = line[10:]
+                # Embed.fields builds a new list on every access, so read it once
+                showFields = embeds[0].fields
+                startMatch = showStartPattern.search(showFields[1].value) if len(showFields) > 1 else None
+                return {
+                    "etag": eventETAG,
+                    "eventID": eventID,
+                    "summary": searchEmbed.title,
+                    "url": url, 
+                    "fields": showFields,
+                    "embed": embeds[0],
+                    "start": int(startMatch.group(1)) if startMatch else None,
+                    "id": messageID,
+                }
+    return None
+
+def findShow(channelIndex: dict, event: gcal.ShowEvent) -> dict | None:
+    """
+    Finds an event's show embed in a threads channel's show index. Show embeds are matched by event id, and then by ETAG for show embeds posted before event ids were added to them. 
+
+    Arguments:
+        ChannelIndex - show index of the threads channel
+        Event - event to find the show embed of
+
+    Returns: dict - show embed information (see parseShowEmbed), or None if the event has no show embed.
+    """
+    return channelIndex.get(event.id) or channelIndex.get(event.etag)
+
+def getShowIndexReady(channelID: int) -> asyncio.Event:
+    """
+    Gets the event that's set once a threads channel's show index is built. 
+
+    Arguments:
+        ChannelID - Discord threads channel id
+
+    Returns: asyncio.Event
+    """
+    ready = showIndexReady.get(channelID)
+    if ready is None:
+        ready = showIndexReady[channelID] = asyncio.Event()
+    return ready
+
+def indexShowEmbed(channelID: int, messageID: int, url: str, embeds: list[discord.Embed], checkArchived: bool = True) -> None:
+    """
+    Adds, updates, or removes a message in the show index, depending on if it's (still) a show embed. Archived shows are left out. 
+
+    Arguments:
+        ChannelID - Discord threads channel id the message is in
+        MessageID - Discord message id 
+        Url - Discord jump URL to the message
+        Embeds - the message's embeds
+        CheckArchived - check the signup store for whether the show was archived. Callers that already left archived shows out can skip it. 
+
+    Returns: None
+    """
+    unindexShowEmbed(channelID, messageID)
+    foundThread = parseShowEmbed(messageID, url, embeds)
+    if foundThread and not (checkArchived and signups.isShowArchived(messageID)):
+        recordShowIndexChange(channelID, messageID, foundThread)
+        channelIndex = showIndex.get(channelID)
+        if channelIndex is not None:
+            showKey = foundThread['eventID'] or foundThread['etag']
+            channelIndex[showKey] = foundThread
+            showIndexMessages[messageID] = showKey
+            invalidateUpcomingShow(channelID, showKey)
+
+def unindexShowEmbed(channelID: int, messageID: int) -> None:
+    """
+    Removes a message from the show index, if it's in it. 
+
+    Arguments:
+        ChannelID - Discord channel id the message is in
+        MessageID - Discord message id 
+
+    Returns: None
+    """
+    recordShowIndexChange(channelID, messageID, None)
+    showKey = showIndexMessages.pop(messageID, None)
+    channelIndex = showIndex.get(channelID, {})
+    if showKey is not None and channelIndex.get(showKey, {}).get('id') == messageID:
+        del channelIndex[showKey]
+        invalidateUpcomingShow(channelID, showKey)
+
+def recordShowIndexChange(channelID: int, messageID: int, foundThread: dict | None) -> None:
+    """
+    Records a message event's change to the show index, if the channel's show index is being built. 
+
+    Arguments:
+        ChannelID - Discord threads channel id the message is in
+        MessageID - Discord message id 
+        FoundThread - show embed information of the message (see parseShowEmbed), or None if it was unindexed
+
+    Returns: None
+    """
+    changes = showIndexChanges.get(channelID)
+    if changes is not None:
+        # Keep changes in the order they were last made
+        changes.pop(messageID, None)
+        changes[messageID] = foundThread
+
+async def buildShowIndex(guildConfig: dict) -> None:
+    """
+    Builds a guild's show index from the full history of its threads channel. 
+
+    The index is built on the side and swapped in under the guild's thread creation lock, so a /threads run never loses the shows it posted while the history was read. 
+    If the channel can't be read, the error is printed and the guild is left without a show index (see isShowIndexBuilt)- other guilds are never held up by it. 
+
+    Arguments:
+        GuildConfig - guild config of the guild (see addGuildConfig)
+
+    Returns: None
     """
-    channel = client.get_channel(int(threadsChannel))
-
-    threads = []
-    async for message in channel.history(limit=int(searchLimit)):
-        if message.embeds:
-            for searchEmbed in message.embeds:
-                for field in searchEmbed.fields:
-                    if "Calendar ID:" in field.value:
-                        eventETAG = field.value[13:]
-                        foundThread = {
-                            "etag": eventETAG,
-                            "summary": searchEmbed.title,
-                            "url": message.jump_url, 
-                            "fields": message.embeds[0].fields,
-                        }
-                        threads.append(foundThread)
-    return threads
+    channelID = guildConfig['threadsChannel']
+    channel = client.get_channel(channelID)
+    ready = getShowIndexReady(channelID)
+
+    if not isShowIndexBuilt(channelID):
+        ready.clear()
+    changes = showIndexChanges[channelID] = {}
+    try:
+        if channel is None:
+            raise RuntimeError("channel not found")
+        with stats.span("index.build"):
+            messages = [message async for message in channel.history(limit=None) if message.embeds]
+        async with threadCreationLocks.setdefault(channelID, asyncio.Lock()):
+            # History is newest first- index oldest first so that the newest embed wins if an event was posted twice
+            # Messages changed by message events since are added after, from their latest change
+            channelIndex = {}
+            indexedMessages = {}
+            archivedShowIDs = signups.getArchivedShowIDs()
+            foundThreads = (parseShowEmbed(message.id, message.jump_url, message.embeds) for message in reversed(messages)
+                            if message.id not in archivedShowIDs and message.id not in changes)
+            for foundThread in (*foundThreads, *changes.values()):
+                if foundThread:
+                    showKey = foundThread['eventID'] or foundThread['etag']
+                    replaced = channelIndex.get(showKey)
+                    if replaced:
+                        del indexedMessages[replaced['id']]
+                    channelIndex[showKey] = foundThread
+                    indexedMessages[foundThread['id']] = showKey
+
+            for foundThread in showIndex.get(channelID, {}).values():
+                showIndexMessages.pop(foundThread['id'], None)
+            showIndex[channelID] = channelIndex
+            showIndexMessages.update(indexedMessages)
+            upcomingFieldCache.pop(channelID, None)
+            invalidateUpcomingShow(channelID, None)
+    except Exception as error:
+        print(f"An error occurred building the show index of threads channel {channelID}: {error}")
+    finally:
+        del showIndexChanges[channelID]
+        ready.set()
+
+def isShowIndexBuilt(channelID: int) -> bool:
+    """
+    Checks if a threads channel's show index was built. Show threads are never created without it, as every show would look new. 
+
+    Arguments:
+        ChannelID - Discord threads channel id
+
+    Returns: bool - true if the show index was built, false if building it failed.
+    """
+    return channelID in showIndex
+
+async def searchThreads(channelID: int) -> list[dict]:
+    """
+    Gets the show embeds in a threads channel from the show index. 
+
+    Arguments:
+        ChannelID - Discord threads channel id
+
+    Returns: list[dict] of show embed information for each found embed (see parseShowEmbed)
+    """
+    return list(showIndex.get(channelID, {}).values())
+
+"""
+NEEDED VOLUNTEERS
+
+Each show's needed volunteers are kept as a live tally- staffing category to number of volunteers still needed under the show's staffing rule (see staffing.py). 
+The tally is worked out from the show's roster the first time it's needed, and again on every signup change, so /upcoming and /needs never count signups from show embed text. 
+"""
+
+# Message id -> staffing category -> number of volunteers still needed
+showNeeds = {}
+
+# Staffing category -> emoji shown for each needed volunteer
+staffingEmojis = {
+    "booker": bookerEmoji,
+    "door": doorEmoji,
+    "sound": soundEmoji,
+    "oncall": onCallEmoji,
+    "vendor": vendorEmoji,
+}
+
+def getShowNeeds(foundThread: dict) -> dict[str, int]:
+    """
+    Gets a show's needed volunteers tally, working it out if it isn't known yet. 
+
+    Arguments:
+        FoundThread - show embed information of the show (see parseShowEmbed)
+
+    Returns: dict[str, int] - staffing category to number of volunteers still needed. Fully staffed categories are left out.
+    """
+    needed = showNeeds.get(foundThread['id'])
+    if needed is None:
+        roster = loadShowRoster(foundThread['id'], foundThread['embed'])
+        needed = showNeeds[foundThread['id']] = staffing.neededVolunteers(staffingRules.needsFor(foundThread['summary']), roster)
+    return needed
+
+def updateShowNeeds(message: discord.Message) -> None:
+    """
+    Updates a show's needed volunteers tally after its signups or event changed. 
+
+    Arguments:
+        Message - Discord.py message of the show embed.
+
+    Returns: None
+    """
+    foundThread = showIndex.get(message.channel.id, {}).get(showIndexMessages.get(message.id))
+    summary = foundThread['summary'] if foundThread else message.embeds[0].title
+    showNeeds[message.id] = staffing.neededVolunteers(staffingRules.needsFor(summary), getShowRoster(message))
 
 async def createNeededVolunteers(threads: dict) -> str:
     """
-    With a given embed, get the currently signed up users and format it into a "Needed Volunteers" string. 
+    With a given embed, get its needed volunteers tally and format it into a "Needed Volunteers" string. 
 
     Arguments:
-        Threads- dictionary containing embed information, generally found by using searchThreads.  Should contain the following:
-            etag: Event's google calendar ETAG
-            summary: Event summary
-            url: Discord jump URL to embed
-            fields: Embed fields (used for needed volunteers)
+        Threads- dictionary containing embed information, generally found by using searchThreads (see parseShowEmbed).
     
     Returns: String containing needed volunteer emojis for each needed volunteer. 
     """
-    # Get volunteer counts
-    bookerCount = 0
-    doorCount = 0
-    soundCount = 0
-    bookerCount += threads['fields'][3].value.count('@') # Add number of bookers
-    doorCount += threads['fields'][4].value.count('@') # Add number of door volunteers
-    soundCount += threads['fields'][5].value.count('@') # Add number of sound volunteers
-    doorCount += threads['fields'][6].value.count('@') # Add number of door trainees
-    soundCount += threads['fields'][7].value.count('@') # Add number of sound trainees
-
-    # Create string of emojis representing needed volunteers
-    neededVolunteerString = ""
-
-    while bookerCount < 1:
-        neededVolunteerString += f"{bookerEmoji} "
-        bookerCount += 1
-
-    while doorCount < 2:
-        neededVolunteerString += f"{doorEmoji} "
-        doorCount += 1
-
-    while soundCount < 1:
-        neededVolunteerString += f"{soundEmoji}"
-        soundCount += 1
+    return " ".join(staffingEmojis[category] for category, count in getShowNeeds(threads).items() for _ in range(count))
     
-    return neededVolunteerString
+async def createUpcomingField(channelID: int, event: gcal.ShowEvent) -> tuple[str, str]:
+    """
+    Creates an event's field for the upcoming shows embed. 
+
+    Arguments: 
+        channelID(int) - threads channel id to look for the event's show embed in.
+        event(gcal.ShowEvent) - event to create the field for. 
+
+    Returns: tuple[str, str] - field name (event summary) and field value (start date, and thread link and needed volunteers if a thread exists). 
+    """
+    # Search for thread
+    foundThreadDict = findShow(showIndex.get(channelID, {}), event)
     
-async def createUpcomingShows(events: list[dict]) -> discord.Embed:
+    # Create listing of upcoming shows
+    startTimeUNIXSeconds = int(event.start)
+
+    if foundThreadDict:
+        # Thread is found for show, include thread jump link and needed volunteers
+        neededVolunteerString = await createNeededVolunteers(foundThreadDict)
+        # Put field together
+        return (event.summary,
+                f"**Date**: <t:{startTimeUNIXSeconds}:F> // <t:{startTimeUNIXSeconds}:R>\n**Thread**: {foundThreadDict['url']}\n**Needed Volunteers**: {neededVolunteerString if neededVolunteerString else 'None'}")
+    else:
+        # Thread is not found- exclude thread jump link and needed volunteers
+        return (event.summary,
+                f"**Date**: <t:{startTimeUNIXSeconds}:F> // <t:{startTimeUNIXSeconds}:R>")
+
+async def createUpcomingShows(channelID: int, events: list[gcal.ShowEvent]) -> discord.Embed:
     """
     Creates an upcoming shows embed. The embed is formatted as the following:
 
@@ -256,50 +789,159 @@ async def createUpcomingShows(events: list[dict]) -> discord.Embed:
         Field value: Start Date (absolute and relative), thread link (if one exists), and volunteers needed (if thread link exists)
     Footer: Timestamp
 
+    Fields are taken from the upcoming cache when they're in it. 
+
+    Arguments:
+        ChannelID - threads channel id to look for show embeds in
+        Events - events to list
+
     Returns: discord.Embed - Created upcoming shows embed.
 
     """
     # Create embed
     embed = discord.Embed(title="Upcoming Events")
     
-    # Search for threads
-    threads = await searchThreads()
-
+    channelIndex = showIndex.get(channelID, {})
+    fieldCache = upcomingFieldCache.setdefault(channelID, {})
     for event in events:
-
-        foundThreadDict = None
-        for d in threads:
-            if event['etag'] == d['etag']:
-                # thread found
-                foundThreadDict = d
-        
-        # Create listing of upcoming shows
-        if 'dateTime' not in event['start']:
-            # All day event
-            startTime = datetime.datetime.fromisoformat(event['start']['date'])
+        foundThread = findShow(channelIndex, event)
+        showKey = (foundThread['eventID'] or foundThread['etag']) if foundThread else event.id
+        cached = fieldCache.get(showKey)
+        if cached is not None and cached[0] == event.etag:
+            field = cached[1]
         else:
-            # Normal event with start time
-            startTime = datetime.datetime.fromisoformat(event['start']['dateTime'])
-        startTimeUNIXSeconds = int(startTime.timestamp())
-
-        if foundThreadDict:
-            # Thread is found for show, include thread jump link and needed volunteers
-            neededVolunteerString = await createNeededVolunteers(foundThreadDict)
-            # Put field together
-            embed.add_field(name=event['summary'],
-                            value=f"**Date**: <t:{startTimeUNIXSeconds}:F> // <t:{startTimeUNIXSeconds}:R>\n**Thread**: {foundThreadDict['url']}\n**Needed Volunteers**: {neededVolunteerString if neededVolunteerString else 'None'}", 
-                            inline = False)
-        else:
-            # Thread is not found- exclude thread jump link and needed volunteers
-            embed.add_field(name=event['summary'],
-                            value=f"**Date**: <t:{startTimeUNIXSeconds}:F> // <t:{startTimeUNIXSeconds}:R>", 
-                            inline = False)
-            
-        embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
+            field = await createUpcomingField(channelID, event)
+            fieldCache[showKey] = (event.etag, field)
+        embed.add_field(name=field[0], value=field[1], inline=False)
+
+    embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
 
     return embed
 
-async def createShowEmbed(event: dict) -> discord.Embed:
+"""
+UPCOMING CACHE
+
+/upcoming lists events from a snapshot of the calendar, taken once per threads channel and shared by /upcoming calls until it's out of date. Each page of the snapshot is only rendered when it's shown, and is then cached with the snapshot. 
+
+Fields are cached per show key (see SHOW INDEX), along with the ETAG of the event they were built from. An event's ETAG changes whenever the event is edited, so a field is rebuilt when its event is edited, and is dropped when its show's signups or show embed change. 
+Snapshots are retaken when the calendar changes or when the first listed event ends. Rendered pages are dropped whenever a field is dropped, and are rebuilt from the cached fields. 
+"""
+
+# Threads channel id -> show key -> (event ETAG, (field name, field value))
+upcomingFieldCache = {}
+
+# Threads channel id -> cached snapshot- dict of version (calendar store version), expires (datetime), events (list[gcal.ShowEvent]), and pages (page number -> discord.Embed)
+upcomingPageCache = {}
+
+# Bumped whenever the cache is invalidated, so pages built during an invalidation aren't cached
+upcomingGeneration = 0
+
+# Events listed per /upcoming page
+upcomingPageSize = 15
+
+# Seconds /upcoming page buttons keep working after they were last used
+upcomingTimeout = 600
+
+def invalidateUpcomingShow(channelID: int, showKey: str | None) -> None:
+    """
+    Drops a show's cached /upcoming field and its threads channel's rendered pages. 
+
+    Arguments:
+        ChannelID - Discord threads channel id of the show
+        ShowKey - show key of the show (see SHOW INDEX), or None if the show isn't in the show index. 
+
+    Returns: None
+    """
+    global upcomingGeneration
+    upcomingFieldCache.get(channelID, {}).pop(showKey, None)
+    cached = upcomingPageCache.get(channelID)
+    if cached:
+        cached['pages'].clear()
+    upcomingGeneration += 1
+
+def getUpcomingEvents(guildConfig: dict) -> list[gcal.ShowEvent]:
+    """
+    Gets a snapshot of a guild's upcoming events for /upcoming, from the upcoming cache if it's still valid. 
+
+    Arguments:
+        GuildConfig - guild config of the guild (see addGuildConfig)
+
+    Returns: list[gcal.ShowEvent] - upcoming events, in start order. The list must not be changed. 
+    """
+    channelID = guildConfig['threadsChannel']
+    version = gcal.storeVersions.get(guildConfig['calendar'], 0)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cached = upcomingPageCache.get(channelID)
+    if cached and cached['version'] == version and now < cached['expires']:
+        return cached['events']
+
+    # Events are listed up to the horizon. The first event past it is kept, as the snapshot expires once the horizon reaches it
+    horizonDays = guildConfig['horizonDays']
+    horizon = now.timestamp() + horizonDays * 86400 if horizonDays is not None else None
+    events = []
+    nextEvent = None
+    for event in gcal.iterUpcomingEvents(guildConfig['calendar']):
+        if horizon is not None and event.start >= horizon:
+            nextEvent = event
+            break
+        events.append(event)
+
+    # Drop fields of events that are no longer listed
+    listedKeys = {event.id for event in events} | {event.etag for event in events}
+    fieldCache = upcomingFieldCache.get(channelID, {})
+    for showKey in list(fieldCache):
+        if showKey not in listedKeys:
+            del fieldCache[showKey]
+
+    # The snapshot expires when a listed event ends, or when the next event comes within the horizon
+    expiryTimes = [event.end for event in events]
+    if nextEvent is not None:
+        expiryTimes.append(nextEvent.start - horizonDays * 86400)
+    expires = datetime.datetime.max.replace(tzinfo=datetime.timezone.utc)
+    if expiryTimes:
+        expires = datetime.datetime.fromtimestamp(min(expiryTimes), datetime.timezone.utc)
+    upcomingPageCache[channelID] = {"version": version, "expires": expires, "events": events, "pages": {}}
+    return events
+
+def getUpcomingPageCount(events: list[gcal.ShowEvent]) -> int:
+    """
+    Gets the number of /upcoming pages needed to list events. There's always at least one page. 
+
+    Arguments:
+        Events - upcoming events snapshot (see getUpcomingEvents)
+
+    Returns: int - number of pages.
+    """
+    return max(1, -(-len(events) // upcomingPageSize))
+
+async def getUpcomingPage(guildConfig: dict, events: list[gcal.ShowEvent], pageNumber: int) -> discord.Embed:
+    """
+    Gets one /upcoming page of an events snapshot, rendering it if it isn't cached. 
+
+    Arguments:
+        GuildConfig - guild config of the guild (see addGuildConfig)
+        Events - upcoming events snapshot (see getUpcomingEvents)
+        PageNumber - page to get, starting at 0
+
+    Returns: discord.Embed - upcoming shows embed of the page.
+    """
+    channelID = guildConfig['threadsChannel']
+    # Rendered pages are only shared between /upcoming calls using the same snapshot
+    cached = upcomingPageCache.get(channelID)
+    pages = cached['pages'] if cached and cached['events'] is events else None
+    if pages is not None and pageNumber in pages:
+        return pages[pageNumber]
+
+    generation = upcomingGeneration
+    embed = await createUpcomingShows(channelID, events[pageNumber * upcomingPageSize:(pageNumber + 1) * upcomingPageSize])
+    if not events:
+        embed.description = "No upcoming events."
+    embed.set_footer(text=f"Page {pageNumber + 1} of {getUpcomingPageCount(events)}")
+    if pages is not None and generation == upcomingGeneration:
+        pages[pageNumber] = embed
+    return embed
+
+async def createShowEmbed(event: gcal.ShowEvent) -> discord.Embed:
     """
     Creates a show embed for the given event- used for /threads
 
@@ -314,21 +956,15 @@ async def createShowEmbed(event: dict) -> discord.Embed:
         Field 7- Sound Training signups
         Field 8- On-Call signups
         Field 9- Vendor signups
-        Field 10- etag
+        Field 10- etag and event id
     
-    Arguments: event(dict) - event dictionary to create embed for. Should be from Google Calendar. 
+    Arguments: event(gcal.ShowEvent) - event to create embed for. 
 
     Returns: discord.Embed - Created show embed.
     """
-    if 'dateTime' not in event['start']:
-        # All day event
-        startTime = datetime.datetime.fromisoformat(event['start']['date'])
-    else:
-        # Normal event with start time
-        startTime = datetime.datetime.fromisoformat(event['start']['dateTime'])
-    startTimeUNIXSeconds = int(startTime.timestamp())
+    startTimeUNIXSeconds = int(event.start)
 
-    embed = discord.Embed(title=f"{event['summary']}", description="")
+    embed = discord.Embed(title=f"{event.summary}", description="")
     
     # Fields
     embed.add_field(name="", 
@@ -362,10 +998,59 @@ async def createShowEmbed(event: dict) -> discord.Embed:
                     value="",
                     inline=True)
     embed.add_field(name="",
-                    value=f"Calendar ID: {event['etag']}",
+                    value=f"Calendar ID: {event.etag}\nEvent ID: {event.id}",
                     inline=False)
     return embed
             
+class UpcomingView(discord.ui.View):
+    """
+    View with previous and next page buttons for /upcoming. Pages are rendered from the events snapshot taken when /upcoming was run, when they're shown. Only the user that ran /upcoming can change the page. 
+    """
+
+    def __init__(self, guildConfig: dict, events: list[gcal.ShowEvent], userID: int):
+        super().__init__(timeout=upcomingTimeout)
+        self.guildConfig = guildConfig
+        self.events = events
+        self.userID = userID
+        self.pageNumber = 0
+        self.pageCount = getUpcomingPageCount(events)
+        # Followup message the view is on, set by /upcoming once it's sent
+        self.message = None
+        self.updateButtons()
+
+    def updateButtons(self) -> None:
+        self.previousButtonCallback.disabled = self.pageNumber <= 0
+        self.nextButtonCallback.disabled = self.pageNumber >= self.pageCount - 1
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.userID:
+            await outbound.submit(outbound.INTERACTION, None, interaction.response.send_message("Only the user that ran /upcoming can change its page.", ephemeral=True))
+            return False
+        return True
+
+    async def showPage(self, interaction: discord.Interaction, pageNumber: int) -> None:
+        with stats.span("upcoming.page"):
+            self.pageNumber = min(max(pageNumber, 0), self.pageCount - 1)
+            self.updateButtons()
+            embed = await getUpcomingPage(self.guildConfig, self.events, self.pageNumber)
+            await outbound.submit(outbound.INTERACTION, None, interaction.response.edit_message(embed=embed, view=self))
+
+    @discord.ui.button(label="Previous", row=0, style=discord.ButtonStyle.secondary)
+    async def previousButtonCallback(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self.showPage(interaction, self.pageNumber - 1)
+
+    @discord.ui.button(label="Next", row=0, style=discord.ButtonStyle.secondary)
+    async def nextButtonCallback(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self.showPage(interaction, self.pageNumber + 1)
+
+    async def on_timeout(self) -> None:
+        # Remove the buttons once they stop working
+        if self.message is not None:
+            try:
+                await outbound.submit(outbound.BULK, None, self.message.edit(view=None))
+            except discord.HTTPException as error:
+                print(f"An error occurred removing /upcoming page buttons: {error}")
+
 class ThreadView(discord.ui.View):
     """
     View to create show signup buttons for show embeds. Also handles users that press each button on a show thread to add them to a show embed & thread. 
@@ -376,10 +1061,15 @@ class ThreadView(discord.ui.View):
         super().__init__(timeout=None)
 
     async def userSignUp(button: discord.Button, slot: int) -> None:
-        message = button.message
-        await addUserToThread(message, button.user)
-        await addUserToEmbed(message, slot, button.user)
-        await button.response.send_message("Added you to the show thread!", ephemeral=True)
+        with stats.span("button.signup"):
+            message = button.message
+            with stats.span("signup.embed"):
+                await addUserToEmbed(message, slot, button.user)
+            # Respond before joining the thread, so the response is never held up by other traffic
+            with stats.span("signup.respond"):
+                await outbound.submit(outbound.INTERACTION, None, button.response.send_message("Added you to the show thread!", ephemeral=True))
+            with stats.span("signup.thread"):
+                await addUserToThread(message, button.user)
 
     @discord.ui.button(label="Booker", emoji=bookerEmoji, row=0, style=discord.ButtonStyle.primary, custom_id="bookerButton")
     async def bookerButtonCallback(self, button: discord.Button, interaction: discord.Interaction) -> None:
@@ -411,47 +1101,146 @@ class ThreadView(discord.ui.View):
         
     @discord.ui.button(label="Remove", row=2, style=discord.ButtonStyle.danger, custom_id="RemoveButton")
     async def removeButtonCallback(self, button: discord.Button, interaction: discord.Interaction) -> None:
-        message = button.message
-        # check if user is in thread
-        if await getUserCurrentRole(button.user, button.message) == -1:
-            # user not in thread
-            await button.response.send_message("You aren't in the thread.", ephemeral=True)
-        else:
-            # remove user from embed
-            await removeUserFromEmbed(button.user, button.message)
-            # remove user from thread
-            # get base message
+        with stats.span("button.remove"):
             message = button.message
-            # get thread
-            thread = message.thread
-            await thread.remove_user(button.user)
-            await button.response.send_message("Removed you from the show thread.", ephemeral=True)
+            # check if user is in thread
+            if await getUserCurrentRole(button.user, button.message) == -1:
+                # user not in thread
+                await outbound.submit(outbound.INTERACTION, None, button.response.send_message("You aren't in the thread.", ephemeral=True))
+            else:
+                # remove user from embed
+                await removeUserFromEmbed(button.user, button.message)
+                # remove user from thread
+                # get base message
+                message = button.message
+                await outbound.submit(outbound.INTERACTION, None, button.response.send_message("Removed you from the show thread.", ephemeral=True))
+                await removeUserFromThread(message, button.user)
+
+# Threads channel id -> background calendar sync task of the guild, started by on_ready
+calendarSyncTasks = {}
+
+# Threads channel id -> background archive task of the guild, started by on_ready
+archiveTasks = {}
+
+# Metrics endpoint server, started by on_ready
+metricsServer = None
+
+async def syncCommandTree() -> bool:
+    """
+    Syncs the command tree to Discord, unless it hasn't changed since the last sync. 
+
+    Syncing is a global, rate limited request, so a fingerprint (hash) of the synced commands is kept in the signup store, and the sync is skipped when the fingerprint still matches. 
+
+    Returns: bool - true if the command tree was synced, false if it was unchanged. 
+    """
+    commands = [command.to_dict(tree) for command in tree.get_commands()]
+    fingerprint = hashlib.sha256(json.dumps([client.application_id, commands], sort_keys=True).encode()).hexdigest()
+    if signups.getState("commandTreeFingerprint") == fingerprint:
+        return False
+    await outbound.submit(outbound.USER, "commands:global", tree.sync(guild=None))
+    signups.setState("commandTreeFingerprint", fingerprint)
+    return True
 
 @client.event
 async def on_ready():
     """
-    Ran when the bot connects to Discord. Prints to console that it connected successfully, syncs the command tree (all the slash commands used to interact with the bot), and adds the buttons above so they can be used past reboot. 
+    Ran when every shard has connected to Discord. Prints to console that it connected successfully, gives the default config to its guild, syncs the command tree (all the slash commands used to interact with the bot) if it changed, adds the buttons above so they can be used past reboot, builds each guild's show index the first time it connects, and starts the background Google credential refresh and each guild's background calendar sync and archiving. 
 
     Arguments- None
     Returns- None
     """
     print(f'Logged in as {client.user}')
-    await tree.sync(guild=None)
+    resolveDefaultGuild()
+    await syncCommandTree()
     ThreadViewInstance = ThreadView()
     client.add_view(ThreadViewInstance)
+    # Each guild's show index is built on its own- a guild whose channel can't be read doesn't hold up the others
+    # Show indexes are only built once- on_ready runs again on every reconnect, which then doesn't wait on the channel history. A failed build is retried
+    await asyncio.gather(*(buildShowIndex(guildConfig) for guildConfig in guildConfigs.values()
+                           if not isShowIndexBuilt(guildConfig['threadsChannel']) and guildConfig['threadsChannel'] not in showIndexChanges))
+    # Start the background calendar syncs, once- on_ready runs again on every reconnect
+    # Each guild syncs on its own, so a slow calendar never holds up the others
+    global metricsServer
+    gcal.startCredentialRefresh()
+    for guildConfig in guildConfigs.values():
+        if syncInterval and guildConfig['threadsChannel'] not in calendarSyncTasks:
+            calendarSyncTasks[guildConfig['threadsChannel']] = asyncio.create_task(calendarSyncLoop(guildConfig))
+        if archiveAfterHours and guildConfig['threadsChannel'] not in archiveTasks:
+            archiveTasks[guildConfig['threadsChannel']] = asyncio.create_task(archiveLoop(guildConfig))
+    # Start the metrics endpoint, once
+    if metricsPort and metricsServer is None:
+        metricsServer = await stats.startMetricsServer(metricsPort)
+
+@client.event
+async def on_thread_member_join(member: discord.ThreadMember) -> None:
+    """
+    Ran when a user joins a thread (needs threadMemberEvents). Updates the thread membership cache. 
+    """
+    setThreadMember(member.thread_id, member.id, True)
+
+@client.event
+async def on_raw_thread_member_remove(payload: discord.RawThreadMembersUpdate) -> None:
+    """
+    Ran when users leave or are removed from a thread, even if it isn't in the cache (needs threadMemberEvents). Updates the thread membership cache. 
+    """
+    for userID in payload.data.get('removed_member_ids', []):
+        setThreadMember(payload.thread_id, int(userID), False)
+
+@client.event
+async def on_raw_thread_delete(payload: discord.RawThreadDeleteEvent) -> None:
+    """
+    Ran when a thread is deleted. Drops it from the thread membership cache. 
+    """
+    threadMembers.pop(payload.thread_id, None)
+
+@client.event
+async def on_message(message: discord.Message) -> None:
+    """
+    Ran when a message is sent. Adds new show embeds in the threads channel to the show index. 
+    """
+    if message.channel.id in channelConfigs:
+        indexShowEmbed(message.channel.id, message.id, message.jump_url, message.embeds)
+
+@client.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent) -> None:
+    """
+    Ran when a message is edited, even if it isn't in the message cache. Updates show embeds in the show index. 
+    """
+    if payload.channel_id in channelConfigs and 'embeds' in payload.data:
+        embeds = [discord.Embed.from_dict(embed) for embed in payload.data['embeds']]
+        url = f"https://discord.com/channels/{payload.guild_id}/{payload.channel_id}/{payload.message_id}"
+        indexShowEmbed(payload.channel_id, payload.message_id, url, embeds)
+
+@client.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent) -> None:
+    """
+    Ran when a message is deleted, even if it isn't in the message cache. Removes show embeds from the show index. 
+    """
+    unindexShowEmbed(payload.channel_id, payload.message_id)
+    showNeeds.pop(payload.message_id, None)
+
+@client.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent) -> None:
+    """
+    Ran when messages are bulk deleted. Removes show embeds from the show index. 
+    """
+    for messageID in payload.message_ids:
+        unindexShowEmbed(payload.channel_id, messageID)
+        showNeeds.pop(messageID, None)
 
 @tree.command(name="upcoming", description="Display upcoming events")
 async def upcoming(interaction: discord.Interaction) -> None:
     """
     Handles /upcoming command. 
 
-    It creates a list of events from the google calendar with the following information:
+    It creates a list of events from the guild's google calendar with the following information:
         Event summary (title of event from Google Calendar)
         Date of event (both in absolute time and relative to current time)
         Link to show thread, if one exists
-        Needed volunteers, if a show thread exists (Standard need requirements are one booker, two door volunteers, and one sound volunteer). Trainees are considered in their main role if signed up. (Door trainees are considered door volunteers and sound trainees are considered sound volunteers). 
+        Needed volunteers, if a show thread exists (Need requirements are set per show type by the staffing rules- by default one booker, two door volunteers, and one sound volunteer). Trainees are considered in their main role if signed up. (Door trainees are considered door volunteers and sound trainees are considered sound volunteers). 
 
-    The embed created has a title of "Upcoming Events" and the body of the embed consists of fields with one field per event. 
+    The embed created has a title of "Upcoming Events" and the body of the embed consists of fields with one field per event, 15 events per page. 
+    Only the first page is rendered and sent. If there's more than one page, it's sent with previous and next buttons, and the other pages are rendered from the same snapshot of events when they're shown (see UpcomingView). 
 
     If the user is a bot admin as defined by the role in the config.ini file, the embed is sent to all users. Otherwise, it is sent ephemerally (to that user only).
 
@@ -467,30 +1256,37 @@ async def upcoming(interaction: discord.Interaction) -> None:
     # If user has the botAdminRole, the message should be sent to all (not ephermerally)
     # otherwise, it's still ok to run, but it should be sent to the user only. (ephermerally)
 
-    ephermeral = None
-    if await isUserBotAdmin(interaction.user):
-        # user is a bot admin
-        await interaction.response.defer(ephemeral=False)
-        ephermeral = False
-    else:
-        # user is not a bot admin
-        await interaction.response.defer(ephemeral=True)
-        ephermeral = True
-    
-    events = gcal.upcomingEvents(calendar_id)
-
-    embeds = []
-    # Seperate events into groups of 15 for embeds
-    i = 0
-    while i < len(events):
-        eventSubset = events[i:i + 15]
-        embed = await createUpcomingShows(eventSubset)
-        embeds.append(embed)
-        i += 15
-
-    # Send result
-    for embed in embeds:
-        await interaction.followup.send(embed=embed, ephemeral=ephermeral)
+    with stats.span("command.upcoming"):
+        guildConfig = await getInteractionGuildConfig(interaction)
+        if guildConfig is None:
+            return
+
+        ephermeral = None
+        with stats.span("upcoming.defer"):
+            if await isUserBotAdmin(interaction.user, guildConfig):
+                # user is a bot admin
+                await outbound.submit(outbound.INTERACTION, None, interaction.response.defer(ephemeral=False))
+                ephermeral = False
+            else:
+                # user is not a bot admin
+                await outbound.submit(outbound.INTERACTION, None, interaction.response.defer(ephemeral=True))
+                ephermeral = True
+        
+        # Sync the calendar if it hasn't been synced recently
+        with stats.span("upcoming.gcal"):
+            await gcal.refreshEvents(guildConfig['calendar'], syncMaxAge)
+
+        with stats.span("upcoming.render"):
+            events = getUpcomingEvents(guildConfig)
+            embed = await getUpcomingPage(guildConfig, events, 0)
+
+        # Send result
+        with stats.span("upcoming.send"):
+            if getUpcomingPageCount(events) > 1:
+                view = UpcomingView(guildConfig, events, interaction.user.id)
+                view.message = await outbound.submit(outbound.INTERACTION, None, interaction.followup.send(embed=embed, view=view, ephemeral=ephermeral))
+            else:
+                await outbound.submit(outbound.INTERACTION, None, interaction.followup.send(embed=embed, ephemeral=ephermeral))
 
 # Threads Command
 @tree.command(name="threads", description="Create new show threads")
@@ -500,11 +1296,11 @@ async def threads(interaction: discord.Interaction) -> None:
 
     Command requires user to be a bot admin, as defined by the role in the config.ini file.
 
-    If the user is a bot admin, /threads will create new show threads in the channel defined in the config.ini file. 
+    If the user is a bot admin, /threads will create new show threads in the guild's threads channel defined in the config.ini file. 
     
     To setup the event, each event has a unique etag as returned by Google. The etag changes every time the event is edited.
 
-    The bot checks over the last 100 messages to see if the etag is present in any embed in the defined thread channel. If the etag is present, it ignores the event as it assumes the show already has a thread. Otherwise, it continues to create the show embed and show thread. 
+    The bot checks the show index to see if the event's id is present in any embed in the defined thread channel. If it is, the show already has a thread- if the event was edited since (its etag changed), the show embed's title and dates are updated in place, keeping its signups, and otherwise the event is ignored. If it isn't, it continues to create the show embed and show thread. 
 
     The show embeds include a title and 11 fields.
         Field 0- number of people signed up for the show. 
@@ -517,7 +1313,7 @@ async def threads(interaction: discord.Interaction) -> None:
         Field 7- Sound Training signups
         Field 8- On-Call signups
         Field 9- Vendor signups
-        Field 10- etag
+        Field 10- etag and event id
 
     Arguments:
         interaction - Discord.py interaction information
@@ -525,63 +1321,367 @@ async def threads(interaction: discord.Interaction) -> None:
     Returns: None
     """
 
+    guildConfig = await getInteractionGuildConfig(interaction)
+    if guildConfig is None:
+        return
+
     # Check if user can run command
 
-    if not await isUserBotAdmin(interaction.user):
+    if not await isUserBotAdmin(interaction.user, guildConfig):
         # User is not a bot admin
-        await interaction.response.send_message(f"You must have the {botAdminRole} role to use this command.", ephemeral=True)
+        await outbound.submit(outbound.INTERACTION, None, interaction.response.send_message(f"You must have the {guildConfig['botAdminRole']} role to use this command.", ephemeral=True))
         return        
 
     # Prompt discord for the "Bot is thinking...." message
-    await interaction.response.defer(ephemeral=True)
-
-    # Get Upcoming Events
-    events = gcal.upcomingEvents(calendar_id)
+    await outbound.submit(outbound.INTERACTION, None, interaction.response.defer(ephemeral=True))
+
+    with stats.span("command.threads"):
+        try:
+            createdThreads, updatedShows, ignoredEvents, failedThreads = await createMissingThreads(guildConfig, interaction)
+        except RuntimeError as error:
+            await outbound.submit(outbound.INTERACTION, None, interaction.followup.send(f"Threads could not be created: {error}.", ephemeral=True))
+            return
     
-    # Get previously posted embeds
-    channel = client.get_channel(int(threadsChannel))
-    invalidETAGs = []
+    # Send closing message
+    closingMessage = f"{createdThreads} thread(s) were created successfully. {updatedShows} show(s) were updated. {ignoredEvents} calendar events were ignored."
+    if failedThreads:
+        closingMessage += f" {failedThreads} thread(s) could not be created."
+    await outbound.submit(outbound.INTERACTION, None, interaction.followup.send(closingMessage, ephemeral=True))
 
-    threads = await searchThreads()
-    for thread in threads:
-        eventETAG = thread['fields'][10].value[13:]
-        if not (eventETAG in invalidETAGs):
-            invalidETAGs.append(eventETAG)
+async def createMissingThreads(guildConfig: dict, interaction: discord.Interaction | None = None, maxAge: float = 0) -> tuple[int, int, int, int]:
+    """
+    Creates a show embed and show thread for every upcoming event of a guild that doesn't have one yet, and updates the show embeds of events that were edited since they were posted. Used by /threads and the calendar sync tasks. 
 
-    
-    # Count of threads created
-    createdThreads = 0
-    ignoredEvents = 0
+    Only one run happens at a time per guild, and runs wait for the guild's show index to be built, so a show is never posted twice. 
 
-    for event in events:
-        # Check if thread has already been posted
-        if not event['etag'] in invalidETAGs: 
-            # If thread has not been posted, create a new thread. 
-
-            embed = await createShowEmbed(event)
-
-            currentThreadView = ThreadView()
-            # Send embed
-            newThread = await channel.send(embed=embed, view=currentThreadView)
-            # Create Thread
-            await newThread.create_thread(name=event['summary'])
-            createdThreads += 1
-        else:
-            ignoredEvents += 1
-    
-    # Send closing message
-    await interaction.followup.send(f"{createdThreads} thread(s) were created successfully. {ignoredEvents} calendar events were ignored.", ephemeral=True)
+    Arguments:
+        GuildConfig - guild config of the guild (see addGuildConfig)
+        Interaction - Discord.py interaction to report progress to, or None to run silently. 
+        MaxAge - skip syncing the calendar if it was synced less than this many seconds ago. 
+
+    Returns: tuple[int, int, int, int] - number of threads created, number of show embeds updated, number of events ignored as they already have an up to date thread, and number of threads that could not be created. 
+    """
+    channelID = guildConfig['threadsChannel']
+    await getShowIndexReady(channelID).wait()
+    if not isShowIndexBuilt(channelID):
+        raise RuntimeError(f"the show index of threads channel {channelID} couldn't be built")
+    async with threadCreationLocks.setdefault(channelID, asyncio.Lock()):
+        channel = client.get_channel(channelID)
+        channelIndex = showIndex[channelID]
+
+        # Count of events that already have threads
+        ignoredEvents = 0
+        updatedShows = 0
+
+        # Show embeds are sent one at a time so they stay in date order, while their threads are created in the background
+        threadLimit = asyncio.Semaphore(threadCreationLimit)
+        threadTasks = []
+        lastProgress = asyncio.get_running_loop().time()
+
+        # Get Upcoming Events
+        async for event in gcal.streamUpcomingEvents(guildConfig['calendar'], guildConfig['horizonDays'], maxAge):
+            # Check if thread has already been posted
+            foundThread = findShow(channelIndex, event)
+            if foundThread is None and signups.isEventArchived(event.id):
+                # Show was archived while its event is still running- it's left out of the show index, but mustn't be posted again
+                ignoredEvents += 1
+            elif foundThread is None: 
+                # If thread has not been posted, create a new thread. 
+
+                embed = await createShowEmbed(event)
+
+                currentThreadView = ThreadView()
+                # Send embed
+                newThread = await outbound.submit(outbound.BULK, f"channel:{channel.id}", channel.send(embed=embed, view=currentThreadView))
+                signups.trackShow(newThread.id, {})
+                rosters[newThread.id] = ShowRoster()
+                indexShowEmbed(channelID, newThread.id, newThread.jump_url, newThread.embeds)
+                # Create Thread
+                threadTasks.append(asyncio.create_task(createShowThread(newThread, event.summary, threadLimit)))
+
+                # Report progress
+                now = asyncio.get_running_loop().time()
+                if interaction and now - lastProgress >= progressInterval:
+                    lastProgress = now
+                    createdSoFar = sum(task.done() for task in threadTasks)
+                    await outbound.submit(outbound.INTERACTION, None, interaction.edit_original_response(content=f"Posted {len(threadTasks)} show(s), {createdSoFar} thread(s) created so far..."))
+            elif foundThread['eventID'] != event.id or foundThread['etag'] != event.etag:
+                # Event was edited since its show embed was posted, or the show embed doesn't have its event id yet
+                try:
+                    await updateShowEmbed(channel, foundThread, event)
+                    updatedShows += 1
+                except discord.HTTPException as error:
+                    print(f"An error occurred updating show embed {foundThread['id']}: {error}")
+            else:
+                ignoredEvents += 1
+
+        # Wait for the remaining threads
+        results = await asyncio.gather(*threadTasks, return_exceptions=True)
+        failedThreads = [result for result in results if isinstance(result, Exception)]
+        for error in failedThreads:
+            print(f"An error occurred creating a show thread: {error}")
+
+        return len(results) - len(failedThreads), updatedShows, ignoredEvents, len(failedThreads)
+
+async def updateShowEmbed(channel: discord.TextChannel, foundThread: dict, event: gcal.ShowEvent) -> None:
+    """
+    Updates a show embed in place for an edited event- its title, dates, and calendar ids are replaced, and its signups are kept. The show thread is renamed if the event summary changed. 
+
+    Arguments:
+        Channel - Discord.py threads channel the show embed is in
+        FoundThread - show embed information of the show (see parseShowEmbed)
+        Event - the event as it is now
+
+    Returns: None
+    """
+    message = await outbound.submit(outbound.BULK, f"fetch:{channel.id}", channel.fetch_message(foundThread['id']))
+    embed = getShowRoster(message).renderInto(await createShowEmbed(event))
+    # Wait for any signup edit being sent, so it can't overwrite the update. Indexing the new embed first means later signup edits render from it
+    lock = embedEditLocks.setdefault(message.id, asyncio.Lock())
+    async with lock:
+        indexShowEmbed(channel.id, message.id, message.jump_url, [embed])
+        # The event summary picks the staffing rule, so the tally may change
+        showNeeds.pop(message.id, None)
+        with stats.span("embed.update"):
+            await outbound.submit(outbound.BULK, f"channel:{channel.id}", message.edit(embed=embed))
+    if not lock.locked() and message.id not in queuedEmbedEdits:
+        embedEditLocks.pop(message.id, None)
+
+    thread = message.thread
+    if thread is not None and foundThread['summary'] != event.summary:
+        await outbound.submit(outbound.BULK, f"thread:{thread.id}", thread.edit(name=event.summary))
+
+# Threads channel id -> lock held while the channel's show threads are being created
+threadCreationLocks = {}
+
+async def calendarSyncLoop(guildConfig: dict) -> None:
+    """
+    Background task that syncs a guild's calendar every syncInterval seconds, and creates show threads for new events if autoThreads is on. 
+
+    Each wait is jittered by up to 10% so syncs don't line up with other periodic traffic, and the first sync happens at a random point in the first interval. 
+    While syncs are failing, the wait doubles after each failure, up to maxSyncBackoff seconds. 
+
+    Arguments:
+        GuildConfig - guild config of the guild (see addGuildConfig)
+
+    Returns: None
+    """
+    failures = 0
+    await asyncio.sleep(random.uniform(0, syncInterval))
+    while True:
+        try:
+            with stats.span("sync.gcal"):
+                synced = await gcal.refreshEvents(guildConfig['calendar'])
+            if not synced:
+                raise RuntimeError("calendar sync failed")
+            if autoThreads:
+                with stats.span("sync.threads"):
+                    createdThreads, updatedShows, ignoredEvents, failedThreads = await createMissingThreads(guildConfig, maxAge=syncInterval)
+                if createdThreads or updatedShows or failedThreads:
+                    print(f"Calendar sync of {guildConfig['calendar']}: {createdThreads} thread(s) created, {updatedShows} show(s) updated, {failedThreads} thread(s) could not be created.")
+            failures = 0
+        except Exception as error:
+            failures += 1
+            print(f"An error occurred during calendar sync of {guildConfig['calendar']}: {error}")
+        delay = min(syncInterval * 2 ** failures, max(syncInterval, maxSyncBackoff))
+        await asyncio.sleep(delay * random.uniform(0.9, 1.1))
+
+"""
+ARCHIVING
+
+Shows are archived archiveAfterHours after they start, so the show index, rosters, and signup store only hold shows that are still coming up. 
+Archiving a show locks and archives its thread, removes the signup buttons from its show embed, and compacts its signups into the signup store's archive. 
+Archived show embeds stay in the threads channel, but are left out of the show index when it's rebuilt. An archived show's event can still be upcoming (archiving goes by start, and the event may still be running), so /threads never posts a show for an event whose show was archived. 
+"""
+
+async def archiveLoop(guildConfig: dict) -> None:
+    """
+    Background task that archives a guild's past shows every archiveInterval seconds. 
+
+    Arguments:
+        GuildConfig - guild config of the guild (see addGuildConfig)
+
+    Returns: None
+    """
+    while True:
+        try:
+            with stats.span("archive.shows"):
+                archivedShows = await archivePastShows(guildConfig)
+            if archivedShows:
+                print(f"Archived {archivedShows} past show(s) in {guildConfig['threadsChannel']}.")
+        except Exception as error:
+            print(f"An error occurred archiving past shows in {guildConfig['threadsChannel']}: {error}")
+        await asyncio.sleep(archiveInterval * random.uniform(0.9, 1.1))
+
+async def archivePastShows(guildConfig: dict) -> int:
+    """
+    Archives every show of a guild that started more than archiveAfterHours ago. 
+
+    Runs under the guild's thread creation lock, so a show is never archived while /threads is updating it. 
+
+    Arguments:
+        GuildConfig - guild config of the guild (see addGuildConfig)
+
+    Returns: int - number of shows archived.
+    """
+    channelID = guildConfig['threadsChannel']
+    await getShowIndexReady(channelID).wait()
+    async with threadCreationLocks.setdefault(channelID, asyncio.Lock()):
+        channel = client.get_channel(channelID)
+        cutoff = datetime.datetime.now(datetime.timezone.utc).timestamp() - archiveAfterHours * 3600
+        pastShows = [foundThread for foundThread in showIndex.get(channelID, {}).values()
+                     if foundThread['start'] is not None and foundThread['start'] < cutoff]
+        archivedShows = 0
+        for foundThread in pastShows:
+            try:
+                await archiveShow(channel, foundThread)
+                archivedShows += 1
+            except discord.HTTPException as error:
+                print(f"An error occurred archiving show {foundThread['id']}: {error}")
+        return archivedShows
+
+async def archiveShow(channel: discord.TextChannel, foundThread: dict) -> None:
+    """
+    Archives a past show. The show is archived in the signup store and dropped from the show index and caches first, so the show embed edit below doesn't add it back. 
+
+    Arguments:
+        Channel - Discord.py threads channel the show embed is in
+        FoundThread - show embed information of the show (see parseShowEmbed)
+
+    Returns: None
+    """
+    messageID = foundThread['id']
+    # Let a queued signup edit finish, so it isn't rendered from an archived show
+    queuedEdit = queuedEmbedEdits.get(messageID)
+    if queuedEdit:
+        await queuedEdit
+    try:
+        message = await outbound.submit(outbound.BULK, f"fetch:{channel.id}", channel.fetch_message(messageID))
+    except discord.NotFound:
+        message = None
+    if message is not None:
+        # Bring signups that are only on the show embed into the signup store before they're archived
+        getShowRoster(message)
+
+    signups.archiveShow(messageID, foundThread['eventID'], foundThread['summary'], foundThread['start'], int(datetime.datetime.now(datetime.timezone.utc).timestamp()))
+    unindexShowEmbed(channel.id, messageID)
+    rosters.pop(messageID, None)
+    showNeeds.pop(messageID, None)
+    threadMembers.pop(messageID, None)
+    if message is None:
+        return
+
+    thread = message.thread
+    if thread is not None:
+        await outbound.submit(outbound.BULK, f"thread:{thread.id}", thread.edit(archived=True, locked=True))
+    await outbound.submit(outbound.BULK, f"channel:{channel.id}", message.edit(view=None))
+
+async def createShowThread(message: discord.Message, name: str, threadLimit: asyncio.Semaphore) -> discord.Thread:
+    """
+    Creates the show thread for a show embed. Used by /threads to create threads concurrently- Discord.py waits out each route's rate limit bucket, and the semaphore caps how many threads are created at once. 
+
+    Arguments:
+        Message - Discord.py message of the show embed.
+        Name - Name of the thread (the event summary).
+        ThreadLimit - Semaphore limiting concurrent thread creation.
+
+    Returns: discord.Thread - Created show thread.
+    """
+    async with threadLimit:
+        return await outbound.submit(outbound.BULK, f"threads:{message.channel.id}", message.create_thread(name=name))
+
+@tree.command(name="stats", description="Show bot latency and request stats")
+async def statsCommand(interaction: discord.Interaction) -> None:
+    """
+    Handles /stats command. 
+
+    Command requires user to be a bot admin, as defined by the role in the config.ini file.
+
+    Shows p50/p95/p99 timings for each command and each stage of commands and button presses, counted events such as Discord rate limit hits, and the outbound scheduler's request counts and queue depths. 
+    The response is sent ephemerally. 
+
+    Arguments:
+        interaction - Discord.py interaction information
+
+    Returns: None
+    """
+    guildConfig = await getInteractionGuildConfig(interaction)
+    if guildConfig is None:
+        return
+    if not await isUserBotAdmin(interaction.user, guildConfig):
+        await outbound.submit(outbound.INTERACTION, None, interaction.response.send_message(f"You must have the {guildConfig['botAdminRole']} role to use this command.", ephemeral=True))
+        return
+
+    lines = [f"{'span':<20} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"]
+    for name, values in stats.summary().items():
+        lines.append(f"{name:<20} {values['count']:>6} {values['p50'] * 1000:>8.1f} {values['p95'] * 1000:>8.1f} {values['p99'] * 1000:>8.1f}")
+    lines.append("")
+    for name, value in sorted(stats.counters.items()):
+        lines.append(f"{name}: {value}")
+    for metric, values in outbound.metrics().items():
+        lines.append(f"outbound {metric}: " + ", ".join(f"{label} {value}" for label, value in values.items()))
+
+    await outbound.submit(outbound.INTERACTION, None, interaction.response.send_message("```\n" + "\n".join(lines)[:1900] + "\n```", ephemeral=True))
+
+@tree.command(name="needs", description="List every understaffed show")
+async def needs(interaction: discord.Interaction) -> None:
+    """
+    Handles /needs command. 
+
+    Command requires user to be a bot admin, as defined by the role in the config.ini file.
+
+    Lists every show that hasn't ended and still needs volunteers under its staffing rule, soonest first, with its date, thread link, and needed volunteers. 
+    Only shows whose event is still on the guild's google calendar are listed, so shows of past and deleted events are left out. The calendar is synced if it wasn't synced recently, and the rest is built from the show index and the needed volunteers tallies, without any calls to Discord. The response is sent ephemerally. 
+
+    Arguments:
+        interaction - Discord.py interaction information
+
+    Returns: None
+    """
+    guildConfig = await getInteractionGuildConfig(interaction)
+    if guildConfig is None:
+        return
+    if not await isUserBotAdmin(interaction.user, guildConfig):
+        await outbound.submit(outbound.INTERACTION, None, interaction.response.send_message(f"You must have the {guildConfig['botAdminRole']} role to use this command.", ephemeral=True))
+        return
+
+    # Prompt discord for the "Bot is thinking...." message, as the show index may still be being built
+    await outbound.submit(outbound.INTERACTION, None, interaction.response.defer(ephemeral=True))
+
+    with stats.span("command.needs"):
+        channelID = guildConfig['threadsChannel']
+        await gcal.refreshEvents(guildConfig['calendar'], syncMaxAge)
+        await getShowIndexReady(channelID).wait()
+        channelIndex = showIndex.get(channelID, {})
+        understaffed = []
+        # Upcoming events are in start order, and only include events that haven't ended
+        for event in gcal.iterUpcomingEvents(guildConfig['calendar']):
+            foundThread = findShow(channelIndex, event)
+            if foundThread is None:
+                continue
+            neededVolunteerString = await createNeededVolunteers(foundThread)
+            if neededVolunteerString:
+                understaffed.append((int(event.start), foundThread, neededVolunteerString))
+
+        # List as many shows as fit in the embed description
+        embed = discord.Embed(title="Understaffed Shows")
+        lines = []
+        length = 0
+        for start, foundThread, neededVolunteerString in understaffed:
+            line = f"<t:{start}:d> [{foundThread['summary']}]({foundThread['url']}): {neededVolunteerString}"
+            if length + len(line) + 1 > 4000:
+                break
+            lines.append(line)
+            length += len(line) + 1
+        embed.description = "\n".join(lines) if lines else "Every show is fully staffed."
+        if len(lines) < len(understaffed):
+            embed.set_footer(text=f"{len(understaffed) - len(lines)} more understaffed show(s) not listed")
+
+    await outbound.submit(outbound.INTERACTION, None, interaction.followup.send(embed=embed, ephemeral=True))
 
 # Role choices for adduser command. 
-@discord.app_commands.choices(role=[
-    discord.app_commands.Choice(name="Booker", value="3"),
-    discord.app_commands.Choice(name="Door", value="4"),
-    discord.app_commands.Choice(name="Sound", value="5"),
-    discord.app_commands.Choice(name="Door Training", value="6"),
-    discord.app_commands.Choice(name="Sound Training", value="7"),
-    discord.app_commands.Choice(name="On Call", value="8"),
-    discord.app_commands.Choice(name="Vendor", value="9"),
-])
+roleChoices = [discord.app_commands.Choice(name=name, value=str(role)) for role, name in showRoleNames.items()]
+@discord.app_commands.choices(role=roleChoices)
 
 
 @tree.command(name="adduser", description="Add a user to a show thread")
@@ -600,46 +1700,256 @@ async def adduser(interaction: discord.Interaction, user: discord.Member, thread
 
     Returns- None
     """
-    # Check if user can run command
-    if not await isUserBotAdmin(interaction.user):
-        await interaction.response.send_message(f"You must have the {botAdminRole} role to use this command.", ephemeral=True)
-        return
+    with stats.span("command.adduser"):
+        guildConfig = await getInteractionGuildConfig(interaction)
+        if guildConfig is None:
+            return
+
+        # Check if user can run command
+        if not await isUserBotAdmin(interaction.user, guildConfig):
+            await outbound.submit(outbound.INTERACTION, None, interaction.response.send_message(f"You must have the {guildConfig['botAdminRole']} role to use this command.", ephemeral=True))
+            return
+    
+        # Tell discord we're thinking
+        await outbound.submit(outbound.INTERACTION, None, interaction.response.defer(ephemeral=True))
+
+        # Thread can only be in the guild's threads channel. 
+        channel = client.get_channel(guildConfig['threadsChannel'])
+
+        # Find thread
+        try:
+            with stats.span("adduser.fetch"):
+                message = await outbound.submit(outbound.USER, f"fetch:{channel.id}", channel.fetch_message(int(thread)))
+        except:
+            # thread is not found
+            await outbound.submit(outbound.INTERACTION, None, interaction.followup.send(f"Thread not found."))
+            return
+
+        # thread is found
+        try:
+            currentRole = await getUserCurrentRole(user, message)
+        except:
+            await outbound.submit(outbound.INTERACTION, None, interaction.followup.send(f"Message is not a show thread."))
+            return
     
-    # Tell discord we're thinking
-    await interaction.response.defer(ephemeral=True)
+        # check if user is already in thread
+        if currentRole == int(role):
+            # user is already in thread as selected role
+            await outbound.submit(outbound.INTERACTION, None, interaction.followup.send(f"<@{user.id}> is already in the thread as selected role."))
+            return
+    
+        await addUserToThread(message, user)
+        await addUserToEmbed(message, int(role), user)
+        await outbound.submit(outbound.INTERACTION, None, interaction.followup.send(f"Added <@{user.id}> to the thread."))
+        return
 
-    # Thread can only be in the specified threads channel. 
-    channel = client.get_channel(int(threadsChannel))
+def parseShowRole(text: str) -> int | None:
+    """
+    Reads a show role from its number or name, as used in bulk assignment files. 
 
-    # Find thread
-    try:
-        message = await channel.fetch_message(int(thread))
-    except:
-        # thread is not found
-        await interaction.followup.send(f"Thread not found.")
-        return
+    Arguments:
+        Text - show role number (such as "4") or name (such as "door training", any case)
+
+    Returns: int - show role id, or None if the text isn't a show role. 
+    """
+    text = text.strip()
+    if text.isdigit():
+        return int(text) if int(text) in showRoleNames else None
+    for role, name in showRoleNames.items():
+        if name.lower() == text.lower():
+            return role
+    return None
+
+def parseBulkAssignments(text: str) -> tuple[list[tuple[int, int, int]], list[str]]:
+    """
+    Reads signups from a bulk assignment CSV file. Each row is: user (id or mention), thread (show embed message id), role (number or name). A header row is allowed. 
 
-    # thread is found
+    Arguments:
+        Text - contents of the CSV file
+
+    Returns: tuple of:
+        list[tuple[int, int, int]] - (message id, user id, show role) for each valid row, in file order
+        list[str] - error for each row that couldn't be read
+    """
+    assignments = []
+    errors = []
+    for lineNumber, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if len(row) != 3:
+            errors.append(f"Line {lineNumber}: expected user, thread, role")
+            continue
+        userMatch = userPattern.fullmatch(row[0].strip())
+        threadText = row[1].strip()
+        role = parseShowRole(row[2])
+        if lineNumber == 1 and not threadText.isdigit():
+            # Header row
+            continue
+        if not userMatch or not threadText.isdigit() or role is None:
+            errors.append(f"Line {lineNumber}: couldn't read `{', '.join(row)}`")
+            continue
+        assignments.append((int(threadText), int(userMatch.group(1) or userMatch.group(2)), role))
+    return assignments, errors
+
+# A user given to a command, as a mention or an id
+userPattern = re.compile(r"<@!?(\d+)>|(\d+)")
+
+# Most user ids one gateway member request can look up
+memberQueryLimit = 100
+
+async def findGuildMembers(guild: discord.Guild, userIDs: set[int]) -> set[int]:
+    """
+    Checks which user ids belong to members of a guild. Members are looked up in the member cache first- it's mostly empty unless threadMemberEvents is on, so the rest are requested over the gateway, memberQueryLimit ids per request, rather than fetched one REST call each. 
+
+    Arguments:
+        Guild - Discord.py guild to look in
+        UserIDs - user ids to check
+
+    Returns: set[int] - the user ids that are members of the guild.
+
+    Raises: asyncio.TimeoutError if Discord doesn't answer a member request.
+    """
+    memberIDs = {userID for userID in userIDs if guild.get_member(userID) is not None}
+    missingIDs = [userID for userID in userIDs if userID not in memberIDs]
+    for i in range(0, len(missingIDs), memberQueryLimit):
+        members = await guild.query_members(user_ids=missingIDs[i:i + memberQueryLimit], limit=memberQueryLimit)
+        memberIDs.update(member.id for member in members)
+    return memberIDs
+
+async def applyShowAssignments(channel: discord.TextChannel, messageID: int, userRoles: dict[int, int]) -> tuple[int, int] | None:
+    """
+    Applies every bulk assignment for one show. The signups are written in one transaction and the show embed is edited once. Every user whose signup changed is added to its thread all at once (skipping known members, see THREAD MEMBERSHIP), paced by the outbound scheduler. 
+
+    Arguments:
+        Channel - Discord.py threads channel of the show
+        MessageID - Discord message id of the show embed
+        UserRoles - dictionary of user id to the show role to sign them up as
+
+    Returns: tuple[int, int] - number of signups changed and number of users that already had their role, or None if the message isn't a show embed. 
+    """
+    if messageID not in showIndexMessages:
+        return None
     try:
-        currentRole = await getUserCurrentRole(user, message)
-    except:
-        await interaction.followup.send(f"Message is not a show thread.")
-        return
-    
-    # check if user is already in thread
-    if currentRole == int(role):
-        # user is already in thread as selected role
-        await interaction.followup.send(f"<@{user.id}> is already in the thread as selected role.")
-        return
-    elif currentRole != -1:
-        # user is in thread, but in a different role
-        await removeUserFromEmbed(user, message)
-    
-    await addUserToThread(message, user)
-    await addUserToEmbed(message, int(role), user)
-    await interaction.followup.send(f"Added <@{user.id}> to the thread.")
-    return
+        message = await outbound.submit(outbound.USER, f"fetch:{channel.id}", channel.fetch_message(messageID))
+    except discord.HTTPException:
+        return None
+
+    roster = getShowRoster(message)
+    changed = {userID: role for userID, role in userRoles.items() if roster.roleOf(userID) != role}
+    if changed:
+        for userID, role in changed.items():
+            roster.move(userID, role)
+        signups.setRoles(message.id, changed)
+        updateShowNeeds(message)
+        invalidateUpcomingShow(channel.id, showIndexMessages.get(message.id))
+        queueShowEmbedEdit(message)
+
+    thread = message.thread
+    if thread is not None and changed:
+        # Users changing roles may have left the thread, so they're added too unless the membership cache knows they're in it
+        results = await asyncio.gather(*(addUserToThread(message, discord.Object(id=userID)) for userID in changed), return_exceptions=True)
+        for error in results:
+            if isinstance(error, Exception):
+                print(f"An error occurred adding a user to show thread {thread.id}: {error}")
+    return len(changed), len(userRoles) - len(changed)
+
+@discord.app_commands.choices(role=roleChoices)
+@tree.command(name="bulkadduser", description="Add many users to many show threads at once")
+async def bulkadduser(interaction: discord.Interaction, users: str | None = None, threads: str | None = None, role: str | None = None, file: discord.Attachment | None = None) -> None:
+    """
+    Handles /bulkadduser [users] [threads] [role] [file]
+
+    Command to forcefully add many users to many show threads at once, such as when staffing a season. The command requires the user to have the bot admin role, as defined in config.ini. 
+
+    Every user in users is added to every thread in threads as role. A CSV file can be attached as well (or instead), with one user, thread, role row per signup. 
+    Only members of the server can be added- anything else (role or channel mentions, ids of users that aren't members) is skipped and reported. 
+    Changes are grouped by show, so each show embed is edited once and each show's new members are added to its thread together, no matter how many users are added. 
+
+    Arguments:
+        Users - string of user mentions or ids, separated by spaces or commas
+        Threads - string of discord message ids of show embed messages, separated by spaces or commas
+        Role - string of the role to add the users as, from the choices above (numerical value only)
+        File - optional CSV attachment of user, thread, role rows. Roles can be given by number or name. 
+
+    Returns- None
+    """
+    with stats.span("command.bulkadduser"):
+        guildConfig = await getInteractionGuildConfig(interaction)
+        if guildConfig is None:
+            return
+
+        # Check if user can run command
+        if not await isUserBotAdmin(interaction.user, guildConfig):
+            await outbound.submit(outbound.INTERACTION, None, interaction.response.send_message(f"You must have the {guildConfig['botAdminRole']} role to use this command.", ephemeral=True))
+            return
+
+        # Tell discord we're thinking
+        await outbound.submit(outbound.INTERACTION, None, interaction.response.defer(ephemeral=True))
+
+        # Read assignments
+        assignments = []
+        errors = []
+        if users or threads or role:
+            if not (users and threads and role):
+                errors.append("users, threads, and role must all be given together.")
+            else:
+                userIDs = []
+                for userText in re.split(r"[\s,]+", users.strip()):
+                    userMatch = userPattern.fullmatch(userText)
+                    if userMatch:
+                        userIDs.append(int(userMatch.group(1) or userMatch.group(2)))
+                    elif userText:
+                        errors.append(f"Not a user: `{userText}`")
+                for messageID in re.findall(r"\d+", threads):
+                    for userID in userIDs:
+                        assignments.append((int(messageID), userID, int(role)))
+        if file is not None:
+            try:
+                fileText = (await outbound.submit(outbound.USER, None, file.read())).decode("utf-8-sig")
+            except (discord.HTTPException, UnicodeDecodeError) as error:
+                errors.append(f"Couldn't read {file.filename}: {error}")
+            else:
+                fileAssignments, fileErrors = parseBulkAssignments(fileText)
+                assignments.extend(fileAssignments)
+                errors.extend(fileErrors)
+
+        # Thread can only be in the guild's threads channel. 
+        channel = client.get_channel(guildConfig['threadsChannel'])
+
+        # Only sign up members of the server
+        userIDs = {userID for _, userID, _ in assignments}
+        try:
+            memberIDs = await findGuildMembers(channel.guild, userIDs)
+        except asyncio.TimeoutError:
+            await outbound.submit(outbound.INTERACTION, None, interaction.followup.send("Discord didn't answer in time when checking who's a member of this server. Nothing was changed, try again."))
+            return
+        notMembers = [str(userID) for userID in userIDs if userID not in memberIDs]
+
+        # Group by show- a later assignment of the same user to the same show wins
+        showAssignments = {}
+        for messageID, userID, showRole in assignments:
+            if userID not in memberIDs:
+                continue
+            userRoles = showAssignments.setdefault(messageID, {})
+            userRoles.pop(userID, None)
+            userRoles[userID] = showRole
+
+        results = await asyncio.gather(*(applyShowAssignments(channel, messageID, userRoles) for messageID, userRoles in showAssignments.items()))
+
+        changedSignups = sum(result[0] for result in results if result)
+        unchangedSignups = sum(result[1] for result in results if result)
+        missingThreads = [str(messageID) for messageID, result in zip(showAssignments, results) if result is None]
+
+        closingMessage = f"Added {changedSignups} signup(s) across {sum(1 for result in results if result)} show(s). {unchangedSignups} user(s) already had their role."
+        if missingThreads:
+            closingMessage += f"\nThreads not found: {', '.join(missingThreads)}"
+        if notMembers:
+            closingMessage += f"\nNot members of this server, skipped: {', '.join(notMembers)}"
+        if errors:
+            closingMessage += "\n" + "\n".join(errors)
+        await outbound.submit(outbound.INTERACTION, None, interaction.followup.send(closingMessage[:2000]))
 
 # Start of "Main"
 # Connect to Discord
-client.run(botToken)
+if __name__ == "__main__":
+    client.run(botToken)
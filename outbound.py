@@ -0,0 +1,234 @@
+"""
+OUTBOUND SCHEDULER
+
+Every request the bot makes to Discord is sent through the outbound scheduler. Requests are queued by priority class, so that under load a volunteer's button response never waits behind a /threads run.
+Interaction requests skip the queue and are sent straight away- they can't wait for a worker held by a rate limited request, and Discord doesn't count them towards the bot's rate limits.
+
+Priority classes, most urgent first:
+    INTERACTION - interaction responses and followups. These time out if they aren't sent within a few seconds.
+    USER - user facing changes: show embed edits and thread membership.
+    BULK - bulk creation: show embeds and threads posted by /threads.
+
+Requests can name a bucket. Each bucket has a token bucket that's refilled over time, and a request isn't started until its bucket (and the global bucket) has a token.
+"""
+
+import asyncio
+import collections
+import itertools
+from typing import Any, Coroutine
+
+# Priority classes
+INTERACTION = 0
+USER = 1
+BULK = 2
+
+priorityNames = {INTERACTION: "interaction", USER: "user", BULK: "bulk"}
+
+# Number of queued (user and bulk) requests sent at once
+workerCount = 6
+
+# Number of bulk requests sent at once- the remaining workers are always free for user requests
+bulkLimit = 2
+
+# Bucket name prefix -> (capacity, tokens refilled per second). Buckets are named "<prefix>:<id>"
+bucketRates = {
+    "global": (50, 50.0),
+    "channel": (5, 1.0),
+    "thread": (5, 1.0),
+    "threads": (5, 1.0),
+}
+
+class TokenBucket:
+    """
+    Token bucket for a single rate limit bucket. Holds up to capacity tokens and is refilled at rate tokens per second.
+    """
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: int, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        """
+        Refills the bucket for the time passed since it was last refilled.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, now: float) -> float:
+        """
+        Gets how long until the bucket has a token.
+
+        Returns: float - seconds to wait, 0 if a token is available now.
+        """
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+# Bucket name -> TokenBucket
+buckets = {}
+
+# Queued requests: (priority, sequence number, bucket, coroutine, future)
+queue = None
+
+# Order requests of the same priority by when they were submitted
+sequence = itertools.count()
+
+# Worker tasks
+workers = []
+
+# Limits concurrent bulk requests
+bulkSemaphore = None
+
+# Metrics
+queueDepth = collections.Counter()
+maxQueueDepth = collections.Counter()
+inFlight = collections.Counter()
+sent = collections.Counter()
+failed = collections.Counter()
+bucketWaits = collections.Counter()
+
+def getBucket(name: str, now: float) -> TokenBucket | None:
+    """
+    Gets the token bucket for a bucket name, creating it on first use.
+
+    Arguments:
+        Name - bucket name, either "global" or "<prefix>:<id>".
+        Now - current event loop time.
+
+    Returns: TokenBucket, or None if the bucket's prefix has no configured rate.
+    """
+    bucket = buckets.get(name)
+    if bucket is None:
+        rate = bucketRates.get(name.split(":", 1)[0])
+        if rate is None:
+            return None
+        bucket = buckets[name] = TokenBucket(rate[0], rate[1], now)
+    return bucket
+
+def start() -> None:
+    """
+    Starts the outbound workers, if they aren't running already. Must be called from the event loop.
+
+    Returns: None
+    """
+    global queue, bulkSemaphore
+    if workers:
+        return
+    queue = asyncio.PriorityQueue()
+    bulkSemaphore = asyncio.Semaphore(bulkLimit)
+    for _ in range(workerCount):
+        workers.append(asyncio.create_task(worker()))
+
+async def submit(priority: int, bucket: str | None, request: Coroutine) -> Any:
+    """
+    Queues a request to Discord and waits for it to be sent. Interaction requests are sent straight away.
+
+    Arguments:
+        Priority - priority class (INTERACTION, USER, or BULK).
+        Bucket - rate limit bucket name, or None for requests that aren't rate limited by the bot.
+        Request - coroutine that makes the request. It's not started until its turn.
+
+    Returns: the request's result. Exceptions raised by the request are raised here.
+    """
+    if priority == INTERACTION:
+        return await send(priority, request)
+    start()
+    # Requests waiting for a bulk slot count as queued
+    queueDepth[priority] += 1
+    maxQueueDepth[priority] = max(maxQueueDepth[priority], queueDepth[priority])
+    if priority == BULK:
+        try:
+            await bulkSemaphore.acquire()
+        except BaseException:
+            queueDepth[priority] -= 1
+            request.close()
+            raise
+    try:
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((priority, next(sequence), bucket, request, future))
+        return await future
+    finally:
+        if priority == BULK:
+            bulkSemaphore.release()
+
+async def worker() -> None:
+    """
+    Sends queued requests, most urgent first. A request whose bucket is out of tokens is put back on the queue once its bucket refills, so it doesn't hold up other buckets.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await queue.get()
+        priority, _, bucketName, request, future = item
+        queueDepth[priority] -= 1
+
+        if future.done():
+            # Request was cancelled while queued
+            request.close()
+            continue
+
+        # Token accounting
+        now = loop.time()
+        tokenBuckets = []
+        if bucketName is not None:
+            for name in ("global", bucketName):
+                bucket = getBucket(name, now)
+                if bucket is not None:
+                    tokenBuckets.append(bucket)
+        wait = max((bucket.wait(now) for bucket in tokenBuckets), default=0.0)
+        if wait > 0:
+            bucketWaits[bucketName.split(":", 1)[0]] += 1
+            queueDepth[priority] += 1
+            loop.call_later(wait, queue.put_nowait, item)
+            continue
+        for bucket in tokenBuckets:
+            bucket.tokens -= 1
+
+        try:
+            result = await send(priority, request)
+        except Exception as error:
+            if not future.done():
+                future.set_exception(error)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+async def send(priority: int, request: Coroutine) -> Any:
+    """
+    Sends a request, counting it in the metrics.
+
+    Arguments:
+        Priority - priority class of the request.
+        Request - coroutine that makes the request.
+
+    Returns: the request's result. Exceptions raised by the request are raised here.
+    """
+    inFlight[priority] += 1
+    try:
+        result = await request
+    except Exception:
+        failed[priority] += 1
+        raise
+    else:
+        sent[priority] += 1
+        return result
+    finally:
+        inFlight[priority] -= 1
+
+def metrics() -> dict[str, dict[str, int]]:
+    """
+    Gets the scheduler's metrics.
+
+    Returns: dict of metric name to a dict of priority class (or bucket prefix) name to value.
+    """
+    return {
+        "queue_depth": {priorityNames[priority]: queueDepth[priority] for priority in priorityNames},
+        "max_queue_depth": {priorityNames[priority]: maxQueueDepth[priority] for priority in priorityNames},
+        "in_flight": {priorityNames[priority]: inFlight[priority] for priority in priorityNames},
+        "sent": {priorityNames[priority]: sent[priority] for priority in priorityNames},
+        "failed": {priorityNames[priority]: failed[priority] for priority in priorityNames},
+        "bucket_waits": dict(bucketWaits),
+    }
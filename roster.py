@@ -0,0 +1,144 @@
+"""
+SHOW ROSTER
+
+A show roster is the parsed list of signups for a single show: which users are signed up as which show role.
+
+Show roles use the same numbering as the show embed fields (see main.py). Field 0 of the show embed holds the signup count and fields 3 to 9 hold the users signed up for each show role.
+"""
+
+import re
+
+import discord
+
+# Embed fields holding signups, one per show role
+showRoles = range(3, 10)
+
+# Embed field holding the signup count
+countField = 0
+
+# User mention in a show role field
+mentionPattern = re.compile(r"<@!?(\d+)>")
+
+class ShowRoster:
+    """
+    Signups for a single show. Each show role keeps its user ids in an insertion ordered set (a dict with no values), so that signups are shown in the order they were made.
+    A reverse map from user id to show role makes membership checks, role moves, and head counts constant time.
+    """
+    __slots__ = ("roles", "userRoles")
+
+    def __init__(self):
+        # Show role -> ordered set of user ids
+        self.roles = {role: {} for role in showRoles}
+        # User id -> show role
+        self.userRoles = {}
+
+    @classmethod
+    def fromEmbed(cls, embed: discord.Embed) -> "ShowRoster":
+        """
+        Parses a roster from a show embed. User ids are matched as whole mentions, so one user id that's part of another never matches.
+
+        Arguments:
+            Embed - Show embed to parse.
+
+        Returns: ShowRoster - Parsed roster.
+        """
+        roster = cls()
+        fields = embed.fields
+        for role in showRoles:
+            for userID in mentionPattern.findall(fields[role].value):
+                roster.move(int(userID), role)
+        return roster
+
+    @classmethod
+    def fromSignups(cls, showSignups: dict[int, list[int]]) -> "ShowRoster":
+        """
+        Creates a roster from signups in the signup store.
+
+        Arguments:
+            ShowSignups - dictionary of show role to list of user ids, as returned by signups.getSignups.
+
+        Returns: ShowRoster - Created roster.
+        """
+        roster = cls()
+        for role, userIDs in showSignups.items():
+            for userID in userIDs:
+                roster.move(userID, role)
+        return roster
+
+    def roleOf(self, userID: int) -> int:
+        """
+        Gets a user's show role.
+
+        Arguments:
+            UserID - user id to look up.
+
+        Returns: int - show role id or -1 if the user is not signed up.
+        """
+        return self.userRoles.get(userID, -1)
+
+    def move(self, userID: int, role: int) -> int:
+        """
+        Signs a user up as the given show role, moving them out of any role they had before. The user is put at the end of the role's list.
+
+        Arguments:
+            UserID - user id to sign up.
+            Role - show role to sign the user up as.
+
+        Returns: int - previous show role id or -1 if the user was not signed up.
+        """
+        previousRole = self.remove(userID)
+        self.roles[role][userID] = None
+        self.userRoles[userID] = role
+        return previousRole
+
+    def remove(self, userID: int) -> int:
+        """
+        Removes a user from the roster.
+
+        Arguments:
+            UserID - user id to remove.
+
+        Returns: int - removed show role id or -1 if the user was not signed up.
+        """
+        previousRole = self.userRoles.pop(userID, -1)
+        if previousRole != -1:
+            del self.roles[previousRole][userID]
+        return previousRole
+
+    def count(self, role: int | None = None) -> int:
+        """
+        Counts signups.
+
+        Arguments:
+            Role - show role to count, or None to count every signup.
+
+        Returns: int - number of users signed up.
+        """
+        if role is None:
+            return len(self.userRoles)
+        return len(self.roles[role])
+
+    def toSignups(self) -> dict[int, list[int]]:
+        """
+        Gets the roster in the format used by the signup store.
+
+        Returns: dict[int, list[int]] - show role to list of user ids, in signup order.
+        """
+        return {role: list(userIDs) for role, userIDs in self.roles.items()}
+
+    def renderInto(self, embed: discord.Embed) -> discord.Embed:
+        """
+        Renders the roster into a copy of a show embed in one pass. Only the signup count and show role fields are changed.
+
+        Arguments:
+            Embed - Show embed to render into.
+
+        Returns: discord.Embed - Rendered show embed.
+        """
+        embedDict = embed.to_dict()
+        # to_dict shares its field dicts with the embed, so copy them before changing any
+        fields = embedDict['fields'] = [dict(field) for field in embedDict['fields']]
+        fields[countField]['value'] = f":busts_in_silhouette: {len(self.userRoles)}"
+        for role, userIDs in self.roles.items():
+            fields[role]['value'] = "\n".join(f"<@{userID}>" for userID in userIDs)
+        return discord.Embed.from_dict(embedDict)
@@ -0,0 +1,242 @@
+"""
+SIGNUP STORE
+
+The signup store is the source of truth for who is signed up to which show, and as which show role. Show embeds are rendered from it.
+
+Shows are keyed by the message id of their show embed. Show roles use the same numbering as the show embed fields (see main.py).
+
+Shows that are over are archived: their signups are compacted into one archived_shows row, so the live tables only hold shows that are still coming up.
+
+The store also keeps small bits of bot state that need to survive a restart, such as the command tree fingerprint.
+"""
+
+import json
+import sqlite3
+
+# Database connection, opened with openStore
+connection = None
+
+def openStore(path: str) -> None:
+    """
+    Opens (and creates if needed) the signup store database.
+
+    Arguments:
+        Path - file path of the SQLite database.
+
+    Returns: None
+    """
+    global connection
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS shows (
+            message_id INTEGER PRIMARY KEY
+        )""")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS signups (
+            message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            role INTEGER NOT NULL,
+            PRIMARY KEY (message_id, user_id)
+        )""")
+    connection.execute("CREATE INDEX IF NOT EXISTS signups_by_role ON signups (message_id, role)")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS archived_shows (
+            message_id INTEGER PRIMARY KEY,
+            event_id TEXT,
+            summary TEXT,
+            start INTEGER,
+            archived_at INTEGER NOT NULL,
+            signups TEXT NOT NULL
+        )""")
+    connection.execute("CREATE INDEX IF NOT EXISTS archived_shows_by_event ON archived_shows (event_id)")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS bot_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )""")
+
+def isShowTracked(messageID: int) -> bool:
+    """
+    Checks if a show is in the signup store.
+
+    Arguments:
+        MessageID - message id of the show embed.
+
+    Returns: bool - true if the show is in the signup store, false otherwise.
+    """
+    row = connection.execute("SELECT 1 FROM shows WHERE message_id = ?", (messageID,)).fetchone()
+    return row is not None
+
+def trackShow(messageID: int, showSignups: dict[int, list[int]]) -> None:
+    """
+    Adds a show to the signup store along with its existing signups. Used to bring shows posted before the signup store existed into it.
+
+    Arguments:
+        MessageID - message id of the show embed.
+        ShowSignups - dictionary of show role to list of user ids signed up as that role, in signup order.
+
+    Returns: None
+    """
+    with connection:
+        connection.execute("BEGIN")
+        connection.execute("INSERT OR IGNORE INTO shows (message_id) VALUES (?)", (messageID,))
+        for role, userIDs in showSignups.items():
+            connection.executemany("INSERT OR IGNORE INTO signups (message_id, user_id, role) VALUES (?, ?, ?)",
+                                   [(messageID, userID, role) for userID in userIDs])
+
+def getRole(messageID: int, userID: int) -> int:
+    """
+    Gets the user's current show role.
+
+    Arguments:
+        MessageID - message id of the show embed.
+        UserID - user id to look up.
+
+    Returns: int - show role id or -1 if user is not currently signed up.
+    """
+    row = connection.execute("SELECT role FROM signups WHERE message_id = ? AND user_id = ?", (messageID, userID)).fetchone()
+    return row[0] if row else -1
+
+def setRole(messageID: int, userID: int, role: int) -> int:
+    """
+    Signs a user up for a show as the given role, replacing any role they had before. The user is moved to the end of the role's list.
+
+    Arguments:
+        MessageID - message id of the show embed.
+        UserID - user id to sign up.
+        Role - show role to sign the user up as.
+
+    Returns: int - previous show role id or -1 if user was not signed up.
+    """
+    with connection:
+        connection.execute("BEGIN")
+        previousRole = getRole(messageID, userID)
+        connection.execute("DELETE FROM signups WHERE message_id = ? AND user_id = ?", (messageID, userID))
+        connection.execute("INSERT INTO signups (message_id, user_id, role) VALUES (?, ?, ?)", (messageID, userID, role))
+    return previousRole
+
+def setRoles(messageID: int, userRoles: dict[int, int]) -> None:
+    """
+    Signs many users up for a show at once, in one transaction. Each user is moved to the end of their new role's list, in the given order.
+
+    Arguments:
+        MessageID - message id of the show embed.
+        UserRoles - dictionary of user id to the show role to sign them up as.
+
+    Returns: None
+    """
+    with connection:
+        connection.execute("BEGIN")
+        connection.executemany("DELETE FROM signups WHERE message_id = ? AND user_id = ?",
+                               [(messageID, userID) for userID in userRoles])
+        connection.executemany("INSERT INTO signups (message_id, user_id, role) VALUES (?, ?, ?)",
+                               [(messageID, userID, role) for userID, role in userRoles.items()])
+
+def removeUser(messageID: int, userID: int) -> int:
+    """
+    Removes a user from a show.
+
+    Arguments:
+        MessageID - message id of the show embed.
+        UserID - user id to remove.
+
+    Returns: int - removed show role id or -1 if user was not signed up.
+    """
+    with connection:
+        connection.execute("BEGIN")
+        previousRole = getRole(messageID, userID)
+        connection.execute("DELETE FROM signups WHERE message_id = ? AND user_id = ?", (messageID, userID))
+    return previousRole
+
+def getSignups(messageID: int) -> dict[int, list[int]]:
+    """
+    Gets every signup for a show.
+
+    Arguments:
+        MessageID - message id of the show embed.
+
+    Returns: dict[int, list[int]] - show role to list of user ids signed up as that role, in signup order. Roles without signups are left out.
+    """
+    showSignups = {}
+    for userID, role in connection.execute("SELECT user_id, role FROM signups WHERE message_id = ? ORDER BY rowid", (messageID,)):
+        showSignups.setdefault(role, []).append(userID)
+    return showSignups
+
+def archiveShow(messageID: int, eventID: str | None, summary: str, start: int | None, archivedAt: int) -> None:
+    """
+    Archives a show that's over. Its signups are moved out of the live tables into a single archived_shows row, as JSON of show role to list of user ids.
+
+    Arguments:
+        MessageID - message id of the show embed.
+        EventID - google calendar event id of the show, or None if it isn't known.
+        Summary - event summary.
+        Start - start of the show, in unix seconds, or None if it isn't known.
+        ArchivedAt - time the show was archived, in unix seconds.
+
+    Returns: None
+    """
+    with connection:
+        connection.execute("BEGIN")
+        showSignups = getSignups(messageID)
+        connection.execute("INSERT OR REPLACE INTO archived_shows (message_id, event_id, summary, start, archived_at, signups) VALUES (?, ?, ?, ?, ?, ?)",
+                           (messageID, eventID, summary, start, archivedAt, json.dumps(showSignups)))
+        connection.execute("DELETE FROM signups WHERE message_id = ?", (messageID,))
+        connection.execute("DELETE FROM shows WHERE message_id = ?", (messageID,))
+
+def isShowArchived(messageID: int) -> bool:
+    """
+    Checks if a show was archived.
+
+    Arguments:
+        MessageID - message id of the show embed.
+
+    Returns: bool - true if the show was archived, false otherwise.
+    """
+    row = connection.execute("SELECT 1 FROM archived_shows WHERE message_id = ?", (messageID,)).fetchone()
+    return row is not None
+
+def getArchivedShowIDs() -> set[int]:
+    """
+    Gets the message ids of every archived show.
+
+    Returns: set[int] - message ids of archived show embeds.
+    """
+    return {row[0] for row in connection.execute("SELECT message_id FROM archived_shows")}
+
+def isEventArchived(eventID: str) -> bool:
+    """
+    Checks if a google calendar event's show was archived.
+
+    Arguments:
+        EventID - google calendar event id of the show.
+
+    Returns: bool - true if a show of the event was archived, false otherwise.
+    """
+    row = connection.execute("SELECT 1 FROM archived_shows WHERE event_id = ?", (eventID,)).fetchone()
+    return row is not None
+
+def getState(key: str) -> str | None:
+    """
+    Gets a stored bot state value.
+
+    Arguments:
+        Key - name of the value.
+
+    Returns: str - the value, or None if it was never set.
+    """
+    row = connection.execute("SELECT value FROM bot_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def setState(key: str, value: str) -> None:
+    """
+    Stores a bot state value, replacing the old one.
+
+    Arguments:
+        Key - name of the value.
+        Value - value to store.
+
+    Returns: None
+    """
+    connection.execute("INSERT OR REPLACE INTO bot_state (key, value) VALUES (?, ?)", (key, value))
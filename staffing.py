@@ -0,0 +1,116 @@
+"""
+STAFFING RULES
+
+Staffing rules say how many volunteers a show needs in each staffing category (booker, door, sound, on-call, and vendor).
+
+Rules are set per show type in the [STAFFING] section of config.ini. Each key is a word or phrase matched against the event summary, and each value lists the needs of that show type, such as "door 1, sound 1". Show types are checked in the order they're set, and shows that match none use the default rule.
+A show's rule is picked once per event summary, and its needed volunteers are worked out from its roster's head counts, so no show embed text is ever parsed to count signups.
+
+Trainees count toward their main category- door trainees are door volunteers and sound trainees are sound volunteers.
+"""
+
+from roster import ShowRoster
+
+# Staffing category -> show roles counting toward it (see main.py for show role numbering)
+staffingCategories = {
+    "booker": (3,),
+    "door": (4, 6),
+    "sound": (5, 7),
+    "oncall": (8,),
+    "vendor": (9,),
+}
+
+# Needs of shows that match no show type, unless config.ini sets a default
+defaultNeeds = {"booker": 1, "door": 2, "sound": 1}
+
+def parseNeeds(text: str) -> dict[str, int]:
+    """
+    Parses a staffing rule, such as "booker 1, door 2, sound 1".
+
+    Arguments:
+        Text - comma separated list of staffing category and number of volunteers needed.
+
+    Returns: dict[str, int] - staffing category to number of volunteers needed.
+
+    Raises: ValueError if a category is unknown or a number is missing.
+    """
+    needs = {}
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, count = part.rpartition(" ")
+        category = name.lower().replace("-", "").replace(" ", "")
+        if category not in staffingCategories or not count.isdigit():
+            raise ValueError(f"Invalid staffing need: {part}")
+        needs[category] = int(count)
+    return needs
+
+def neededVolunteers(needs: dict[str, int], roster: ShowRoster) -> dict[str, int]:
+    """
+    Works out how many more volunteers a show needs.
+
+    Arguments:
+        Needs - staffing rule of the show (see StaffingRules.needsFor).
+        Roster - roster of the show.
+
+    Returns: dict[str, int] - staffing category to number of volunteers still needed, in staffing category order. Categories that are fully staffed are left out.
+    """
+    needed = {}
+    for category, roles in staffingCategories.items():
+        count = needs.get(category, 0) - sum(roster.count(role) for role in roles)
+        if count > 0:
+            needed[category] = count
+    return needed
+
+class StaffingRules:
+    """
+    Staffing rules of every show type. The rule picked for each event summary is cached, as summaries repeat across shows and rules don't change while the bot runs.
+    """
+    __slots__ = ("showTypes", "default", "cache")
+
+    def __init__(self, showTypes: list[tuple[str, dict[str, int]]], default: dict[str, int]):
+        # (lowercase word or phrase, needs) for each show type, in the order they're checked
+        self.showTypes = showTypes
+        self.default = default
+        # Event summary -> needs
+        self.cache = {}
+
+    @classmethod
+    def fromConfig(cls, section) -> "StaffingRules":
+        """
+        Reads staffing rules from the [STAFFING] section of config.ini.
+
+        Arguments:
+            Section - the config section, or an empty dict if there isn't one.
+
+        Returns: StaffingRules - Read rules.
+        """
+        showTypes = []
+        default = defaultNeeds
+        for showType, text in section.items():
+            if showType.lower() == "default":
+                default = parseNeeds(text)
+            else:
+                showTypes.append((showType.lower(), parseNeeds(text)))
+        return cls(showTypes, default)
+
+    def needsFor(self, summary: str | None) -> dict[str, int]:
+        """
+        Gets the staffing rule of a show.
+
+        Arguments:
+            Summary - event summary of the show.
+
+        Returns: dict[str, int] - staffing category to number of volunteers needed.
+        """
+        needs = self.cache.get(summary)
+        if needs is None:
+            needs = self.default
+            lowered = (summary or "").lower()
+            for showType, showTypeNeeds in self.showTypes:
+                if showType in lowered:
+                    needs = showTypeNeeds
+                    break
+            self.cache[summary] = needs
+        return needs
@@ -0,0 +1,182 @@
+"""
+STATS
+
+Timing and counters for the bot's hot paths.
+
+Spans time a stage of a command or button press and record it into a rolling histogram named after the stage, such as "upcoming.gcal". Only the most recent samples of each histogram are kept, so percentiles follow current behaviour.
+Counters count events, such as Discord rate limit hits.
+
+Stats are shown by /stats and served in Prometheus text format by the metrics server.
+"""
+
+import asyncio
+import collections
+import contextlib
+import logging
+import time
+
+import outbound
+
+# Number of recent samples kept per histogram
+sampleLimit = 1024
+
+# Histogram name -> recent samples in seconds
+histograms = {}
+
+# Histogram name -> total number of samples ever recorded
+sampleCounts = collections.Counter()
+
+# Counter name -> count
+counters = collections.Counter()
+
+def record(name: str, seconds: float) -> None:
+    """
+    Records a sample into a histogram.
+
+    Arguments:
+        Name - histogram name.
+        Seconds - sample to record.
+
+    Returns: None
+    """
+    samples = histograms.get(name)
+    if samples is None:
+        samples = histograms[name] = collections.deque(maxlen=sampleLimit)
+    samples.append(seconds)
+    sampleCounts[name] += 1
+
+@contextlib.contextmanager
+def span(name: str):
+    """
+    Times the code inside a with block and records it into a histogram. The time is recorded even if the block raises.
+
+    Arguments:
+        Name - histogram name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+def count(name: str, amount: int = 1) -> None:
+    """
+    Adds to a counter.
+
+    Arguments:
+        Name - counter name.
+        Amount - amount to add.
+
+    Returns: None
+    """
+    counters[name] += amount
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """
+    Gets a percentile of sorted samples, using the nearest rank.
+
+    Arguments:
+        Samples - sorted samples.
+        Fraction - percentile as a fraction, such as 0.95.
+
+    Returns: float - the percentile, or 0 if there are no samples.
+    """
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+def summary() -> dict[str, dict[str, float]]:
+    """
+    Summarizes every histogram.
+
+    Returns: dict of histogram name to a dict of count (total samples ever recorded), p50, p95 and p99 (seconds, over recent samples).
+    """
+    result = {}
+    for name, samples in sorted(histograms.items()):
+        ordered = sorted(samples)
+        result[name] = {
+            "count": sampleCounts[name],
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+        }
+    return result
+
+class RateLimitHandler(logging.Handler):
+    """
+    Logging handler that counts the rate limit warnings Discord.py logs when Discord responds with a 429.
+    """
+    def emit(self, record: logging.LogRecord) -> None:
+        if not isinstance(record.msg, str):
+            return
+        if record.msg.startswith("We are being rate limited"):
+            count("discord.ratelimit")
+        elif record.msg.startswith("Global rate limit"):
+            count("discord.ratelimit.global")
+
+def watchRateLimits() -> None:
+    """
+    Starts counting Discord rate limit hits.
+
+    Returns: None
+    """
+    logger = logging.getLogger("discord.http")
+    if not any(isinstance(handler, RateLimitHandler) for handler in logger.handlers):
+        logger.addHandler(RateLimitHandler(logging.WARNING))
+
+def prometheusText() -> str:
+    """
+    Renders every stat in Prometheus text format, including the outbound scheduler's metrics.
+
+    Returns: str - metrics page.
+    """
+    lines = [
+        "# HELP blucifer_span_seconds Time spent in each stage of commands and button presses.",
+        "# TYPE blucifer_span_seconds summary",
+    ]
+    for name, values in summary().items():
+        for quantile in ("p50", "p95", "p99"):
+            lines.append(f'blucifer_span_seconds{{span="{name}",quantile="0.{quantile[1:]}"}} {values[quantile]:.6f}')
+        lines.append(f'blucifer_span_seconds_count{{span="{name}"}} {values["count"]}')
+
+    lines.append("# HELP blucifer_events_total Counted events, such as Discord rate limit hits.")
+    lines.append("# TYPE blucifer_events_total counter")
+    for name, value in sorted(counters.items()):
+        lines.append(f'blucifer_events_total{{event="{name}"}} {value}')
+
+    for metric, values in outbound.metrics().items():
+        metricType = "counter" if metric in ("sent", "failed", "bucket_waits") else "gauge"
+        labelName = "bucket" if metric == "bucket_waits" else "class"
+        lines.append(f"# TYPE blucifer_outbound_{metric} {metricType}")
+        for label, value in sorted(values.items()):
+            lines.append(f'blucifer_outbound_{metric}{{{labelName}="{label}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+async def handleMetricsRequest(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Answers a single HTTP request to the metrics server with the metrics page.
+    """
+    try:
+        requestLine = await reader.readline()
+        # Skip headers
+        while (await reader.readline()).strip():
+            pass
+        if requestLine.split(b" ")[:2] == [b"GET", b"/metrics"]:
+            status, body = "200 OK", prometheusText().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def startMetricsServer(port: int) -> asyncio.Server:
+    """
+    Starts the metrics server on localhost. Metrics are served at /metrics.
+
+    Arguments:
+        Port - port to listen on.
+
+    Returns: asyncio.Server - the running server.
+    """
+    return await asyncio.start_server(handleMetricsRequest, "127.0.0.1", port)